@@ -3,12 +3,14 @@ Code from COMP0035
 Contains functions to add data to the paralympics database.
 Uses the SQLAlchemy object, db.
 """
+import time
 from importlib import resources
 
-import pandas as pd
-from sqlalchemy import func
+from sqlalchemy import func, insert
 from sqlalchemy.exc import SQLAlchemyError
 
+from student.placeholder.data_prep import host_country_pairs
+from tutor.data.snapshot import read_workbook_sheets
 from tutor.flask_para_t import db
 from tutor.flask_para_t.models import Country, Disability, DisabilityEvent, Event, Host, HostEvent, MedalResult, \
     Participants
@@ -69,27 +71,16 @@ def add_host_data(df_events):
 
     try:
         # Extract unique host name and country pairs
-        # Initialize an empty DataFrame with the columns needed
-        host_country_df = pd.DataFrame(columns=['host', 'country'])
-        # Iterate over each row in the events DataFrame and split each column into multiple values where there is ','
-        for index, row in df_events.iterrows():
-            hosts = row['host'].split(',')
-            countries = row['country'].split(',')
-            # Create pairs of each host with each country and append to the DataFrame
-            for host, country in zip(hosts, countries):
-                new_row = pd.DataFrame({'host': [host.strip()], 'country': [country.strip()]})
-                host_country_df = pd.concat([host_country_df, new_row], ignore_index=True)
-        # Remove duplicate hosts from the dataframe
-        host_country_df = host_country_df.drop_duplicates(subset=['host', 'country'])
-
-        # Iterate over the dataframe, add the host and country to the host table
-        for index, row in host_country_df.iterrows():
-            # Get the country code from the country table
-            country_name = row['country']
-            country = Country.query.filter_by(name=country_name).first()
-            if country:
-                new_host = Host(country_code=country.code, host=row['host'])
-                db.session.add(new_host)
+        host_country_df = host_country_pairs(df_events)
+
+        # Get the country codes from the country table with one query, then look up the code for each host's country
+        country_codes = {country.name: country.code for country in db.session.execute(db.select(Country)).scalars()}
+        host_country_df['country_code'] = host_country_df['country'].map(country_codes)
+        host_country_df = host_country_df.dropna(subset=['country_code'])
+
+        # Add the host and country to the host table
+        db.session.add_all([Host(country_code=row.country_code, host=row.host)
+                            for row in host_country_df.itertuples(index=False)])
         # Commit the changes
         db.session.commit()
 
@@ -192,16 +183,163 @@ def add_medal_result_data(df):
         db.session.rollback()
 
 
-def add_all_data():
+# Number of rows sent to the database in each executemany by the bulk loader
+BULK_BATCH_SIZE = 1000
+
+
+def bulk_insert(model, rows):
+    """Insert a list of dictionaries into the table for model in batches of BULK_BATCH_SIZE.
+
+    Uses a Core insert, so no ORM objects are created. The rows are not committed.
+    """
+    for start in range(0, len(rows), BULK_BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BULK_BATCH_SIZE])
+    return len(rows)
+
+
+def records(df):
+    """Return the rows of a DataFrame as a list of dictionaries with None instead of NaN for missing values."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def event_id_map():
+    """Return a dictionary of (year, type) to event_id for every event."""
+    query = db.select(Event.event_id, Event.year, Event.type)
+    return {(year, event_type): event_id for event_id, year, event_type in db.session.execute(query)}
+
+
+def bulk_add_country_data(df):
+    """Add the country data in batches."""
+    cols = ['code', 'name', 'region', 'sub_region', 'member_type', 'notes']
+    return bulk_insert(Country, records(df[cols]))
+
+
+def bulk_add_event_data(df):
+    """Add the event data, then the participants data, in batches."""
+    cols = ['type', 'year', 'start', 'end', 'countries', 'events', 'sports', 'highlights', 'url']
+    df_event = df[cols].copy()
+    # Convert the dates to strings
+    df_event['start'] = df_event['start'].dt.strftime('%d/%m/%Y')
+    df_event['end'] = df_event['end'].dt.strftime('%d/%m/%Y')
+    rows = bulk_insert(Event, records(df_event))
+
+    # Look up the new event_id for each event by its year and type
+    event_ids = event_id_map()
+    df_participants = df[['participants_m', 'participants_f', 'participants']].copy()
+    df_participants['event_id'] = [event_ids[key] for key in zip(df['year'], df['type'])]
+    return rows + bulk_insert(Participants, records(df_participants))
+
+
+def bulk_add_host_data(df_events):
+    """Add the unique hosts in batches."""
+    host_country_df = host_country_pairs(df_events)
+    country_codes = dict(db.session.execute(db.select(Country.name, Country.code)).all())
+    host_country_df['country_code'] = host_country_df['country'].map(country_codes)
+    host_country_df = host_country_df.dropna(subset=['country_code'])
+    return bulk_insert(Host, records(host_country_df[['country_code', 'host']]))
+
+
+def bulk_add_host_event_data(df):
+    """Add the HostEvent data in batches, using preloaded event and host ids."""
+    event_ids = event_id_map()
+    host_ids = dict(db.session.execute(db.select(Host.host, Host.host_id)).all())
+    rows = []
+    for year, event_type, hosts in zip(df['year'], df['type'], df['host']):
+        event_id = event_ids.get((year, event_type))
+        for host_name in hosts.split(','):
+            host_id = host_ids.get(host_name.strip())
+            if event_id and host_id:
+                rows.append({'host_id': host_id, 'event_id': event_id})
+    return bulk_insert(HostEvent, rows)
+
+
+def bulk_add_disabilities_data(df):
+    """Add the Disability and DisabilityEvent data in batches."""
+    split_disabilities = df['disabilities'].str.split(', ')
+    # Unique values in the order they first appear
+    unique_disabilities = dict.fromkeys(item for sublist in split_disabilities for item in sublist)
+    rows = bulk_insert(Disability, [{'category': d} for d in unique_disabilities])
+
+    event_ids = event_id_map()
+    disability_ids = dict(db.session.execute(db.select(Disability.category, Disability.disability_id)).all())
+    disability_events = []
+    for year, event_type, disabilities in zip(df['year'], df['type'], split_disabilities):
+        event_id = event_ids.get((year, event_type))
+        if event_id:
+            disability_events.extend({'event_id': event_id, 'disability_id': disability_ids[d]} for d in disabilities)
+    return rows + bulk_insert(DisabilityEvent, disability_events)
+
+
+def bulk_add_medal_result_data(df):
+    """Add the MedalResult data in batches, using a preloaded map of year and host name to event_id."""
+    query = db.select(Event.year, Host.host, Event.event_id).join(Event.host_events).join(HostEvent.host)
+    event_ids = {(year, host): event_id for year, host, event_id in db.session.execute(query)}
+    df_medals = df.rename(columns={'NPC': 'country_code', 'Rank': 'rank', 'Gold': 'gold', 'Silver': 'silver',
+                                   'Bronze': 'bronze', 'Total': 'total'})
+    df_medals['event_id'] = [event_ids.get(key) for key in zip(df['Year'], df['Location'])]
+    # Skip results for events that are not in the database, as add_medal_result_data does
+    df_medals = df_medals.dropna(subset=['event_id'])
+    df_medals['event_id'] = df_medals['event_id'].astype(int)
+    cols = ['event_id', 'country_code', 'rank', 'gold', 'silver', 'bronze', 'total']
+    return bulk_insert(MedalResult, records(df_medals[cols]))
+
+
+def bulk_add_all_data(events_df, medals_df, npc_df):
+    """Adds all the data in a single transaction using batched Core inserts.
+
+    Foreign keys are resolved from dictionaries loaded with one query per table, rather than a query per row.
+    As with add_all_data(), data is only added to tables that are empty.
+
+    Returns
+    -------
+    rates: dict of table name and the number of rows per second added
+    """
+    tables_and_functions = [
+        (Country, bulk_add_country_data, npc_df),
+        (Event, bulk_add_event_data, events_df),
+        (Host, bulk_add_host_data, events_df),
+        (HostEvent, bulk_add_host_event_data, events_df),
+        (Disability, bulk_add_disabilities_data, events_df),
+        (MedalResult, bulk_add_medal_result_data, medals_df)
+    ]
+    rates = {}
+    try:
+        for table, add_data_function, data in tables_and_functions:
+            count_query = db.select(func.count()).select_from(table)
+            if db.session.execute(count_query).scalar() != 0:
+                continue
+            start = time.perf_counter()
+            rows = add_data_function(data)
+            seconds = time.perf_counter() - start
+            rates[table.__tablename__] = rows / seconds if seconds else float(rows)
+            print(f'{table.__tablename__}: {rows} rows in {seconds:.3f}s ({rates[table.__tablename__]:.0f} rows/s)')
+        db.session.commit()
+    except SQLAlchemyError as e:
+        print(f'An error occurred adding data to the paralympics database. Error: {e}')
+        db.session.rollback()
+        return {}
+    return rates
+
+
+def add_all_data(bulk=False):
     """Adds all the data.
+
+    Parameters
+    ----------
+    bulk: True to use bulk_add_all_data(), which loads all the tables in one transaction
     """
     # Specifies the path to the data file
     data_path = resources.files("tutor.data").joinpath("paralympics.xlsx")
 
-    # Read data and create pandas dataframes
-    events_df = pd.read_excel(data_path, sheet_name='events')
-    medals_df = pd.read_excel(data_path, sheet_name='medal_standings')
-    npc_df = pd.read_excel(data_path, sheet_name='npc_codes')
+    # Read data and create pandas dataframes, parsing the workbook once, or from the snapshot if it is up to date
+    sheets = read_workbook_sheets(data_path, ['events', 'medal_standings', 'npc_codes'])
+    events_df = sheets['events']
+    medals_df = sheets['medal_standings']
+    npc_df = sheets['npc_codes']
+
+    if bulk:
+        bulk_add_all_data(events_df, medals_df, npc_df)
+        return
 
     # List of tables and corresponding data addition functions and dataframes
     tables_and_functions = [
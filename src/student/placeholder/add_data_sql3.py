@@ -4,9 +4,13 @@ Contains functions to add data to the paralympics database.
 Uses sqlite3
 """
 import sqlite3
+import time
+from contextlib import contextmanager
 from importlib import resources
 
-import pandas as pd
+from student.placeholder.data_prep import host_country_pairs
+from tutor.data.snapshot import read_workbook_sheets
+from tutor.data.workbook import stream_sheets
 
 
 def add_country_data(df, cursor, connection):
@@ -29,9 +33,8 @@ def add_country_data(df, cursor, connection):
 def add_event_data(df, cursor, connection):
     """Add event and participant data to the paralympics database."""
     try:
-        # Convert the dates to strings
-        df['start'] = df['start'].dt.strftime('%d/%m/%Y')
-        df['end'] = df['end'].dt.strftime('%d/%m/%Y')
+        # Convert the dates to strings, in a copy so the DataFrame returned by add_all_data() is unchanged
+        df = df.assign(start=df['start'].dt.strftime('%d/%m/%Y'), end=df['end'].dt.strftime('%d/%m/%Y'))
 
         # Insert the values into the event table
         for index, row in df.iterrows():
@@ -71,30 +74,8 @@ def add_host_data(df_events, cursor, connection):
     """Add data to the normalised paralympics database."""
 
     try:
-        # Extract unique host and country pairs
-        # Initialize an empty DataFrame with the columns needed
-        host_country_df = pd.DataFrame(columns=['host', 'country'])
-        # Iterate over each row in the events DataFrame and split each column into multiple values where there is ','
-        for index, row in df_events.iterrows():
-            hosts = row['host'].split(',')
-            countries = row['country'].split(',')
-            # Create pairs of each host with each country and append to the DataFrame
-            for host, country in zip(hosts, countries):
-                new_row = pd.DataFrame({'host': [host.strip()], 'country': [country.strip()]})
-                host_country_df = pd.concat([host_country_df, new_row], ignore_index=True)
-        # Remove duplicate hosts from the dataframe
-        host_country_df = host_country_df.drop_duplicates(subset=['host', 'country'])
-
-        # Iterate over the dataframe, add the host and country to the host table
-        for index, row in host_country_df.iterrows():
-            # Get the country code from the country table
-            country_name = row['country']
-            select_sql = f'SELECT code from country where name="{country_name}"'
-            result = cursor.execute(select_sql).fetchone()
-            country_code = result[0]
-            # Insert into the host table
-            host = row['host']
-            cursor.execute('INSERT INTO host (country_code, host) VALUES (?, ?)', (country_code, host))
+        # Extract unique host and country pairs and insert them with their country codes
+        bulk_add_host_data(df_events, cursor)
 
         # Commit the changes
         connection.commit()
@@ -193,21 +174,288 @@ def add_medal_result_data(df, cursor, connection):
             connection.rollback()
 
 
-def add_all_data(cur, conn):
+# PRAGMAs used while bulk loading. The database is being rebuilt from the spreadsheet, so durability is traded for speed
+# while the data is loaded and the original settings are restored afterwards.
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -64000,  # negative values are KiB, so 64 MB
+}
+
+
+@contextmanager
+def bulk_load_pragmas(connection, pragmas=None):
+    """Set the bulk load PRAGMAs for the duration of a with block, then restore the original values.
+
+    Parameters
+    ----------
+    connection: sqlite connection object
+    pragmas: dict of PRAGMA name and value, defaults to BULK_LOAD_PRAGMAS
+    """
+    pragmas = BULK_LOAD_PRAGMAS if pragmas is None else pragmas
+    # The journal mode cannot be changed inside a transaction
+    connection.commit()
+    original = {name: connection.execute(f'PRAGMA {name}').fetchone()[0] for name in pragmas}
+    try:
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        yield
+    finally:
+        connection.commit()
+        for name, value in original.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+
+
+def bulk_add_country_data(df, cursor):
+    """Insert all the country rows with one executemany."""
+    cursor.executemany('INSERT INTO country VALUES (?,?,?,?,?,?)', df.itertuples(index=False, name=None))
+    return len(df)
+
+
+def bulk_add_event_data(df, cursor):
+    """Insert all the event rows, then all the participant rows, with one executemany each."""
+    cols = ['type', 'year', 'start', 'end', 'countries', 'events', 'sports', 'highlights', 'url']
+    df_event = df[cols].copy()
+    # Convert the dates to strings
+    df_event['start'] = df_event['start'].dt.strftime('%d/%m/%Y')
+    df_event['end'] = df_event['end'].dt.strftime('%d/%m/%Y')
+    cursor.executemany(
+        'INSERT INTO event (type, year, start, end, countries, events, sports, highlights, url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        df_event.itertuples(index=False, name=None))
+
+    # Look up the new event_id for each event by its year and type
+    event_ids = {(year, event_type): event_id for event_id, year, event_type in
+                 cursor.execute('SELECT event_id, year, type FROM event')}
+    participant_values = [
+        (event_ids[(row.year, row.type)], row.participants_m, row.participants_f, row.participants)
+        for row in df.itertuples(index=False)
+    ]
+    cursor.executemany(
+        'INSERT INTO participants (event_id, participants_m, participants_f, participants) VALUES (?, ?, ?, ?)',
+        participant_values)
+    return len(df) + len(participant_values)
+
+
+def bulk_add_host_data(df_events, cursor):
+    """Insert the unique hosts with one executemany."""
+    host_country_df = host_country_pairs(df_events)
+    # Get the country codes from the country table with one query, then look up the code for each host's country
+    country_codes = dict(cursor.execute('SELECT name, code FROM country').fetchall())
+    host_country_df['country_code'] = host_country_df['country'].map(country_codes)
+    host_country_df = host_country_df.dropna(subset=['country_code'])
+    cursor.executemany('INSERT INTO host (country_code, host) VALUES (?, ?)',
+                       host_country_df[['country_code', 'host']].itertuples(index=False, name=None))
+    return len(host_country_df)
+
+
+def bulk_add_host_event_data(df, cursor):
+    """Insert the host_event rows with one executemany, using preloaded event and host ids."""
+    event_ids = {(year, event_type): event_id for event_id, year, event_type in
+                 cursor.execute('SELECT event_id, year, type FROM event')}
+    host_ids = {host: host_id for host_id, host in cursor.execute('SELECT host_id, host FROM host')}
+    values = []
+    for row in df.itertuples(index=False):
+        event_id = event_ids[(row.year, row.type)]
+        for host in row.host.split(','):
+            values.append((host_ids[host.strip()], event_id))
+    cursor.executemany('INSERT INTO host_event (host_id, event_id) VALUES (?, ?)', values)
+    return len(values)
+
+
+def bulk_add_disabilities_data(df, cursor):
+    """Insert the disabilities and the disability_event rows with one executemany each."""
+    split_disabilities = df['disabilities'].str.split(', ')
+    # Unique values in the order they first appear
+    unique_disabilities = dict.fromkeys(item for sublist in split_disabilities for item in sublist)
+    cursor.executemany('INSERT INTO disability (category) VALUES (?)', [(d,) for d in unique_disabilities])
+
+    event_ids = {(year, event_type): event_id for event_id, year, event_type in
+                 cursor.execute('SELECT event_id, year, type FROM event')}
+    disability_ids = {category: disability_id for disability_id, category in
+                      cursor.execute('SELECT disability_id, category FROM disability')}
+    values = [
+        (event_ids[(year, event_type)], disability_ids[d])
+        for year, event_type, disabilities in zip(df['year'], df['type'], split_disabilities)
+        for d in disabilities
+    ]
+    cursor.executemany('INSERT INTO disability_event (event_id, disability_id) VALUES (?, ?)', values)
+    return len(unique_disabilities) + len(values)
+
+
+def bulk_add_medal_result_data(df, cursor):
+    """Insert the medal results with one executemany, using a preloaded year to event_id map."""
+    # Matches the row by row loader, which uses the first event for the year
+    event_ids = dict(cursor.execute('SELECT year, MIN(event_id) FROM event GROUP BY year').fetchall())
+    df_medals = df[['NPC', 'Rank', 'Gold', 'Silver', 'Bronze', 'Total']].copy()
+    df_medals.insert(0, 'event_id', df['Year'].map(event_ids))
+    cursor.executemany(
+        'INSERT INTO medal_result (event_id, country_code, rank, gold, silver, bronze, total) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        df_medals.itertuples(index=False, name=None))
+    return len(df_medals)
+
+
+def bulk_add_all_data(cur, conn, events_df, medals_df, npc_df):
+    """Adds all the data using batched inserts, with one transaction per table and the bulk load PRAGMAs.
+
+    Parameters
+    ----------
+    conn: sqlite connection object
+    cur: sqlite cursor object
+    events_df, medals_df, npc_df: pandas DataFrames of the 'events', 'medal_standings' and 'npc_codes' sheets
+
+    Returns
+    -------
+    timings: dict of table name and the seconds taken to load it
+    """
+    tables_and_functions = [
+        ('country', bulk_add_country_data, npc_df),
+        ('host', bulk_add_host_data, events_df),
+        ('event', bulk_add_event_data, events_df),
+        ('host_event', bulk_add_host_event_data, events_df),
+        ('disability', bulk_add_disabilities_data, events_df),
+        ('medal_result', bulk_add_medal_result_data, medals_df),
+    ]
+    timings = {}
+    with bulk_load_pragmas(conn):
+        for table, add_data_function, data in tables_and_functions:
+            start = time.perf_counter()
+            try:
+                rows = add_data_function(data, cur)
+                conn.commit()
+            except (sqlite3.Error, KeyError) as e:
+                print(f'An error occurred adding {table} data to the paralympics database. Error: {e}')
+                conn.rollback()
+                continue
+            timings[table] = time.perf_counter() - start
+            print(f'Loaded {rows} rows for {table} in {timings[table]:.3f}s')
+    return timings
+
+
+def stream_add_country_rows(rows, cursor, lookups):
+    """Insert a batch of rows from the npc_codes sheet into the country table."""
+    cursor.executemany('INSERT INTO country VALUES (?,?,?,?,?,?)',
+                       [(r.code, r.name, r.region, r.sub_region, r.member_type, r.notes) for r in rows])
+    lookups.setdefault('country_codes', {}).update((r.name, r.code) for r in rows)
+
+
+def stream_add_event_rows(rows, cursor, lookups):
+    """Insert a batch of rows from the events sheet into the event, participants, host, host_event, disability and
+    disability_event tables."""
+    country_codes = lookups.get('country_codes', {})
+    host_ids = lookups.setdefault('host_ids', {})
+    disability_ids = lookups.setdefault('disability_ids', {})
+    # The first event in each year, used to match the medal results as add_medal_result_data does
+    event_ids = lookups.setdefault('event_ids', {})
+
+    for row in rows:
+        cursor.execute(
+            'INSERT INTO event (type, year, start, end, countries, events, sports, highlights, url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (row.type, row.year, row.start.strftime('%d/%m/%Y'), row.end.strftime('%d/%m/%Y'), row.countries,
+             row.events, row.sports, row.highlights, row.url))
+        event_id = cursor.lastrowid
+        event_ids.setdefault(row.year, event_id)
+        cursor.execute('INSERT INTO participants (event_id, participants_m, participants_f, participants) VALUES (?, ?, ?, ?)',
+                       (event_id, row.participants_m, row.participants_f, row.participants))
+
+        # Add each host the first time it is seen, then link the hosts to the event
+        for host, country in zip(row.host.split(','), row.country.split(',')):
+            host, country = host.strip(), country.strip()
+            if host not in host_ids:
+                if country not in country_codes:
+                    continue
+                cursor.execute('INSERT INTO host (country_code, host) VALUES (?, ?)', (country_codes[country], host))
+                host_ids[host] = cursor.lastrowid
+            cursor.execute('INSERT INTO host_event (host_id, event_id) VALUES (?, ?)', (host_ids[host], event_id))
+
+        # Add each disability category the first time it is seen, then link the categories to the event
+        for category in row.disabilities.split(', '):
+            if category not in disability_ids:
+                cursor.execute('INSERT INTO disability (category) VALUES (?)', (category,))
+                disability_ids[category] = cursor.lastrowid
+            cursor.execute('INSERT INTO disability_event (event_id, disability_id) VALUES (?, ?)',
+                           (event_id, disability_ids[category]))
+
+
+def stream_add_medal_rows(rows, cursor, lookups):
+    """Insert a batch of rows from the medal_standings sheet into the medal_result table."""
+    event_ids = lookups.get('event_ids', {})
+    # pandas reads a rank of 'n/a' as a missing value, store it as NULL in the same way
+    cursor.executemany(
+        'INSERT INTO medal_result (event_id, country_code, rank, gold, silver, bronze, total) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(event_ids.get(r.Year), r.NPC, None if r.Rank == 'n/a' else r.Rank, r.Gold, r.Silver, r.Bronze, r.Total)
+         for r in rows])
+
+
+def stream_add_all_data(cur, conn, data_path=None, batch_size=500):
+    """Adds all the data, reading the workbook once and inserting each batch of rows as it is read.
+
+    No DataFrames are created, so peak memory stays at around one batch of rows for each sheet.
+
+    Parameters
+    ----------
+    conn: sqlite connection object
+    cur: sqlite cursor object
+    data_path: path to the .xlsx file, defaults to paralympics.xlsx in tutor.data
+    batch_size: number of rows read from the workbook at a time
+    """
+    if data_path is None:
+        data_path = resources.files("tutor.data").joinpath("paralympics.xlsx")
+
+    # The sheets are read in this order as the events refer to the countries and the medal results to the events
+    loaders = {
+        'npc_codes': stream_add_country_rows,
+        'events': stream_add_event_rows,
+        'medal_standings': stream_add_medal_rows,
+    }
+    # Ids of the rows already added, shared by the batches
+    lookups = {}
+    try:
+        with bulk_load_pragmas(conn):
+            for sheet_name, rows in stream_sheets(data_path, list(loaders), batch_size):
+                loaders[sheet_name](rows, cur, lookups)
+            conn.commit()
+
+    except sqlite3.Error as e:
+        print(f'An error occurred adding data to the paralympics database. Error: {e}')
+        if conn:
+            conn.rollback()
+
+
+def add_all_data(cur, conn, bulk=False, stream=False):
     """Adds all the data.
 
+    By default the sheets are read into pandas DataFrames, from the Parquet snapshot when it is up to date (see
+    tutor.data.snapshot), and the rows are added one at a time.
+
     Parameters
     ----------
     conn: sqlite connection object
     cur: sqlite cursor object
+    bulk: True to use bulk_add_all_data(), which is much faster for large amounts of data
+    stream: True to use stream_add_all_data(), which parses the workbook once with openpyxl and adds the rows as they
+            are read, so no DataFrames are created. It does not use the snapshot. Ignored if bulk is True.
+
+    Returns
+    -------
+    sheets: dict of sheet name and the DataFrame that was loaded, e.g. for tutor.data.update_db.save_fingerprints().
+            None if stream is True.
     """
     # Specifies the path to the data file
     data_path = resources.files("tutor.data").joinpath("paralympics.xlsx")
 
-    # Read data and create pandas dataframes
-    events_df = pd.read_excel(data_path, sheet_name='events')
-    medals_df = pd.read_excel(data_path, sheet_name='medal_standings')
-    npc_df = pd.read_excel(data_path, sheet_name='npc_codes')
+    if stream and not bulk:
+        stream_add_all_data(cur, conn, data_path)
+        return None
+
+    # Read data and create pandas dataframes, parsing the workbook once, or from the snapshot if it is up to date
+    sheets = read_workbook_sheets(data_path, ['events', 'medal_standings', 'npc_codes'])
+    events_df = sheets['events']
+    medals_df = sheets['medal_standings']
+    npc_df = sheets['npc_codes']
+
+    if bulk:
+        bulk_add_all_data(cur, conn, events_df, medals_df, npc_df)
+        return sheets
 
     # add data to the tables
     add_country_data(npc_df, cur, conn)
@@ -216,3 +464,4 @@ def add_all_data(cur, conn):
     add_host_event_data(events_df, cur, conn)
     add_disabilities_data(events_df, cur, conn)
     add_medal_result_data(medals_df, cur, conn)
+    return sheets
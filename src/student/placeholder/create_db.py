@@ -5,6 +5,7 @@ Contains functions to create the paralympics database without data.
 import sqlite3
 
 from student.placeholder import add_data
+from tutor.data.indexes import create_indexes
 
 
 def create_db(cursor, connection):
@@ -156,6 +157,9 @@ def create_db(cursor, connection):
         cursor.execute(student_response_sql)
         cursor.execute(medal_result_sql)
 
+        # Create the secondary indexes, see tutor.data.indexes
+        create_indexes(cursor)
+
         # Commit the changes
         connection.commit()
 
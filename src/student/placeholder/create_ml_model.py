@@ -6,22 +6,23 @@ This is a simple example of how to create a model using the medal standings data
 from pathlib import Path
 
 import joblib
-import pandas as pd
 from sklearn.compose import ColumnTransformer
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 
+from tutor.data.snapshot import read_sheet
+
 
 def train_and_save_model():
     """
     Train a model to predict Total based on Year and Team, and save it to a .pkl file.
     """
-    # Read the data into a DataFrame
+    # Read the data into a DataFrame, from the snapshot of the workbook if it is up to date
     para_excel = Path(__file__).parent.parent.joinpath("data", "paralympics.xlsx")
     cols = ["Year", "Rank", "Team", "Gold", "Silver", "Bronze", "Total"]
-    data = pd.read_excel(para_excel, sheet_name="medal_standings", usecols=cols)
+    data = read_sheet(para_excel, "medal_standings", usecols=cols)
 
     # Drop rows with NaNs since the accuracy of the model is not the focus here
     data.dropna(inplace=True)
@@ -0,0 +1,32 @@
+"""
+Functions that prepare the paralympics data with pandas before it is added to the database.
+Used by add_data.py and add_data_sql3.py.
+"""
+
+
+def host_country_pairs(df_events):
+    """Split the comma-separated host and country values into one row per unique host and country pair.
+
+    The nth host in a row is paired with the nth country in the same row, e.g. 'Stoke Mandeville, New York' and
+    'UK, USA'. Values without a partner in the other column are dropped, as zip() would.
+
+    Parameters
+    ----------
+    df_events: pandas DataFrame of the events sheet with 'host' and 'country' columns
+
+    Returns
+    -------
+    host_country_df: pandas DataFrame with 'host' and 'country' columns, in the order they first appear
+    """
+    pairs = []
+    for col in ['host', 'country']:
+        # One row per value, keeping the position of the event row and of the value within it
+        values = df_events[col].str.split(',').explode().str.strip().rename(col)
+        values = values.rename_axis('row').reset_index()
+        values['position'] = values.groupby('row').cumcount()
+        pairs.append(values)
+
+    host_country_df = pairs[0].merge(pairs[1], on=['row', 'position'], how='inner')
+    # Remove duplicate hosts from the dataframe
+    host_country_df = host_country_df.drop_duplicates(subset=['host', 'country'])
+    return host_country_df[['host', 'country']].reset_index(drop=True)
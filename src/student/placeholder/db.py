@@ -9,21 +9,38 @@ from datetime import datetime
 import click
 from flask import current_app, g
 
+from student.placeholder.query_profiler import ProfiledConnection, init_profiler
+from tutor.data.memory_replica import MemoryReplica
+from tutor.data.prebuilt_db import provision_db
+from tutor.data.read_only import connect_read_only
+
 
 # Copied from https://flask.palletsprojects.com/en/stable/tutorial/database/
+# Set DATABASE_READ_ONLY = True in the app config to open the database read only, see tutor.data.read_only
+# Set DATABASE_MEMORY_REPLICA = True to query an in-memory copy of the database, see tutor.data.memory_replica
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
+        replica = current_app.extensions.get('memory_replica')
+        if replica is not None:
+            g.db = replica.connect(detect_types=sqlite3.PARSE_DECLTYPES, factory=ProfiledConnection)
+        elif current_app.config.get('DATABASE_READ_ONLY'):
+            g.db = connect_read_only(
+                current_app.config['DATABASE'],
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                factory=ProfiledConnection
+            )
+        else:
+            g.db = sqlite3.connect(
+                current_app.config['DATABASE'],
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                factory=ProfiledConnection
+            )
+            # Enable foreign key support
+            g.db.execute('PRAGMA foreign_keys = ON;')
         g.db.row_factory = sqlite3.Row
 
-        # Enable foreign key support
-        g.db.execute('PRAGMA foreign_keys = ON;')
-
-        # Print SQL to the terminal for debugging purposes
-        g.db.set_trace_callback(trace_callback)
+        # Record the time taken by each statement, see query_profiler.py and the /debug/queries page
+        g.db.profiler = current_app.extensions['query_profiler']
 
     return g.db
 
@@ -38,18 +55,26 @@ def close_db(e=None):
 
 # Modified copy from https://flask.palletsprojects.com/en/stable/tutorial/database/#create-the-tables
 # The SQL file has the data as well as the schema
+# The database is copied from a prebuilt database made from the SQL file, which is only run again when it changes
 def init_db():
+    # Both modes open connections that cannot write, so the data could not be copied into the database
+    for setting in ('DATABASE_READ_ONLY', 'DATABASE_MEMORY_REPLICA'):
+        if current_app.config.get(setting):
+            raise RuntimeError(f'The database cannot be initialised while {setting} is set, unset it and run init-db '
+                               'again.')
     db = get_db()
 
     with importlib.resources.path('tutor.data', 'paralympics.sql') as sql_path:
-        with current_app.open_resource(str(sql_path)) as f:
-            db.executescript(f.read().decode('utf8'))
+        provision_db(db, sql_path)
 
 
 @click.command('init-db')
 def init_db_command():
     """Create new tables and add the data."""
-    init_db()
+    try:
+        init_db()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
     click.echo('Initialized the database.')
 
 
@@ -62,8 +87,8 @@ sqlite3.register_converter(
 def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    init_profiler(app)
+    if app.config.get('DATABASE_MEMORY_REPLICA'):
+        # One copy for each app process, shared by all its requests
+        app.extensions['memory_replica'] = MemoryReplica(app.config['DATABASE'])
 
-
-def trace_callback(query):
-    """Trace function to log queries."""
-    print("Executing query:", query)
@@ -4,11 +4,13 @@ import pandas as pd
 from student.flask_paralympics.models import Event, Participants
 
 
-def line_chart(feature, db):
+def line_chart(feature, db, include_plotlyjs=True):
     """ Creates a line chart with data from paralympics_events.csv
 
      Parameters
      feature: events, sports, countries or participants
+     include_plotlyjs: True to include plotly.js in the html. Use False when the page loads plotly.js from
+                       plotly_js_url(), see plotly_js.py
 
      Returns
      fig_html: Plotly Express line figure html/Javascript
@@ -48,6 +50,6 @@ def line_chart(feature, db):
                   template="simple_white"
                   )
 
-    # Convert to HTML
-    fig_html = {"fig": fig.to_html(full_html=False, include_plotlyjs=True, div_id="line-chart")}
+    # Convert to HTML. plotly.js is several MB, leave it out if the page loads the static copy with plotly_js_url()
+    fig_html = {"fig": fig.to_html(full_html=False, include_plotlyjs=include_plotlyjs, div_id="line-chart")}
     return fig_html
\ No newline at end of file
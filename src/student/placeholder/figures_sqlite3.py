@@ -1,13 +1,17 @@
 import plotly.express as px
 import pandas as pd
 
+from tutor.data.event_summary import has_event_summary
 
-def line_chart(feature, db):
+
+def line_chart(feature, db, include_plotlyjs=True):
     """ Creates a line chart with data from paralympics.xlsx
 
      Parameters
      feature: events, sports, countries or participants
      db: SQLAlchemy database connection object (from get_db())
+     include_plotlyjs: True to include plotly.js in the html. Use False when the page loads plotly.js from
+                       plotly_js_url(), see plotly_js.py
 
      Returns
      fig_html: Plotly Express line figure html
@@ -22,7 +26,12 @@ def line_chart(feature, db):
         feature = feature.lower()
 
     # Get the data from the database using pandas.read_sql_query and the sqlite3 database connection
-    query = 'SELECT * FROM event JOIN participants on event.event_id = participants.event_id;'
+    # Read the event_summary table if the database has one as it needs no join, see tutor.data.event_summary
+    if has_event_summary(db):
+        query = ('SELECT DISTINCT event_id, type, year, countries, events, sports, participants FROM event_summary '
+                 'ORDER BY year;')
+    else:
+        query = 'SELECT * FROM event JOIN participants on event.event_id = participants.event_id;'
     df = pd.read_sql_query(query, db)
 
     # Set the title for the chart using the value of 'feature'
@@ -47,6 +56,6 @@ def line_chart(feature, db):
                   template="simple_white"
                   )
 
-    # Convert to HTML
-    fig_html = {"fig": fig.to_html(full_html=False, include_plotlyjs=True, div_id="line-chart")}
+    # Convert to HTML. plotly.js is several MB, leave it out if the page loads the static copy with plotly_js_url()
+    fig_html = {"fig": fig.to_html(full_html=False, include_plotlyjs=include_plotlyjs, div_id="line-chart")}
     return fig_html
@@ -0,0 +1,111 @@
+"""
+HTTP conditional caching for pages that only change when the data in the database changes.
+
+Decorate a route with @cache_on_db_version. The response gets an ETag and a Last-Modified header made from the version
+of the database file. When the browser or a proxy asks for the page again with If-None-Match or If-Modified-Since and
+the database has not changed, the route answers 304 Not Modified without running the view, so there is no query and
+no template to render.
+
+    @bp.route('/events')
+    @cache_on_db_version
+    def event_list():
+        ...
+
+The version of the database is read from the file, not with a query:
+- the file change counter in the SQLite header, which is increased by every transaction that changes the database
+- the size and modification time of the file, and of its -wal file if it is in WAL mode, where the counter is only
+  updated when the WAL is written back to the database
+
+Config keys:
+    DATABASE: path to the database file, as used by get_db()
+    ETAG_SALT: optional text added to the ETag, change it when the templates change so cached pages are not reused
+    HTTP_CACHE_CONTROL: Cache-Control header for the responses, default 'public, no-cache', which lets browsers and
+                        proxies keep the page but makes them check it is still current with each request
+"""
+import functools
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request
+
+# The file change counter is a 4 byte big-endian integer at offset 24 of the database header
+CHANGE_COUNTER_OFFSET = 24
+
+
+def db_data_version(path):
+    """Return a value that changes whenever the data in a SQLite database file changes.
+
+    Parameters
+    ----------
+    path: path to the database file
+
+    Returns
+    -------
+    version: tuple of the file change counter, the size and mtime of the file and the size and mtime of the -wal file
+    """
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    change_counter = int.from_bytes(header[CHANGE_COUNTER_OFFSET:CHANGE_COUNTER_OFFSET + 4], 'big')
+    stat = os.stat(path)
+    try:
+        wal_stat = os.stat(f'{path}-wal')
+        wal = (wal_stat.st_size, wal_stat.st_mtime_ns)
+    except FileNotFoundError:
+        wal = (0, 0)
+    return (change_counter, stat.st_size, stat.st_mtime_ns) + wal
+
+
+def db_last_modified(path):
+    """Return the time the database was last changed, as a timezone aware datetime rounded down to the second."""
+    mtime = os.stat(path).st_mtime
+    try:
+        mtime = max(mtime, os.stat(f'{path}-wal').st_mtime)
+    except FileNotFoundError:
+        pass
+    # HTTP dates have a resolution of one second
+    return datetime.fromtimestamp(int(mtime), tz=timezone.utc)
+
+
+def db_etag(version, salt=''):
+    """Return the ETag for a database version."""
+    return hashlib.blake2b(f'{version}{salt}'.encode(), digest_size=16).hexdigest()
+
+
+def is_not_modified(etag, last_modified):
+    """Return True if the request's conditional headers show the client already has this version of the page."""
+    # If-None-Match takes precedence over If-Modified-Since when both are sent
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def cache_on_db_version(view):
+    """Decorator for a GET route whose response only changes when the database changes, see the module docstring."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+
+        path = current_app.config['DATABASE']
+        etag = db_etag(db_data_version(path), current_app.config.get('ETAG_SALT', ''))
+        last_modified = db_last_modified(path)
+
+        if is_not_modified(etag, last_modified):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                # Errors and redirects are not cached
+                return response
+
+        # Weak as the page is the same for the same data, though it may not be identical byte for byte
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = current_app.config.get('HTTP_CACHE_CONTROL', 'public, no-cache')
+        return response
+
+    return wrapper
@@ -0,0 +1,141 @@
+"""
+Move this file to the flask_paralympics package with models.py.
+
+Loading profiles and an N+1 query detector for the SQLAlchemy models.
+
+The relationships in models.py are lazy loaded: the related rows are only queried when the attribute is first used. A
+page that lists the events and shows each event's hosts makes one query for the events and then one more query for
+every event, which is known as the N+1 query problem.
+
+A loading profile is a named set of loader options for a common way the models are used. The profile loads the
+relationships the page needs with the first query, e.g.
+
+    stmt = with_profile(db.select(Event), 'event_list')
+    events = db.session.execute(stmt).scalars().all()
+
+In development the detector counts the lazy loads of each relationship during a request and prints a warning when the
+same relationship is lazy loaded N_PLUS_ONE_THRESHOLD times or more, with the profile that would avoid it if there is
+one. Set N_PLUS_ONE_RAISE = True in the app config to raise an error instead, e.g. when running the tests.
+"""
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
+
+from tutor.flask_para_t import db
+from tutor.flask_para_t.models import Country, Event, Host, HostEvent, MedalResult
+
+# selectinload loads a one-to-many relationship for all the rows with one extra SELECT ... WHERE ... IN query.
+# joinedload adds a JOIN to the query, which suits many-to-one and one-to-one relationships as it adds no rows.
+LOADING_PROFILES = {
+    # Events with their hosts and host countries, e.g. a list of events or the map
+    'event_list': [
+        selectinload(Event.host_events).joinedload(HostEvent.host).joinedload(Host.country),
+    ],
+    # Events with their participants, e.g. the line chart
+    'event_participants': [
+        joinedload(Event.participants),
+    ],
+    # Events with the medal table for each event
+    'event_medals': [
+        selectinload(Event.medal_results).joinedload(MedalResult.country),
+    ],
+    # One event with everything shown on its page
+    'event_detail': [
+        selectinload(Event.host_events).joinedload(HostEvent.host).joinedload(Host.country),
+        joinedload(Event.participants),
+        selectinload(Event.medal_results).joinedload(MedalResult.country),
+    ],
+    # Countries with their medal results and the events they were won at
+    'country_medals': [
+        selectinload(Country.medal_results).joinedload(MedalResult.event),
+    ],
+}
+
+# The profile to suggest when a relationship is lazy loaded repeatedly
+PROFILE_FOR_RELATIONSHIP = {
+    'Event.host_events': 'event_list',
+    'HostEvent.host': 'event_list',
+    'Host.country': 'event_list',
+    'Event.participants': 'event_participants',
+    'Event.medal_results': 'event_medals',
+    'MedalResult.country': 'event_medals',
+    'Country.medal_results': 'country_medals',
+    'MedalResult.event': 'country_medals',
+}
+
+
+def loading_options(profile):
+    """Return the loader options of a loading profile.
+
+    Parameters
+    ----------
+    profile: name of a profile in LOADING_PROFILES
+
+    Returns
+    -------
+    options: list of loader options that can be passed to Select.options()
+    """
+    try:
+        return LOADING_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f'Unknown loading profile "{profile}". Must be one of {list(LOADING_PROFILES)}') from None
+
+
+def with_profile(stmt, profile):
+    """Return a select statement that loads the relationships of a loading profile with the query.
+
+    Parameters
+    ----------
+    stmt: SQLAlchemy select statement, e.g. db.select(Event)
+    profile: name of a profile in LOADING_PROFILES
+
+    Returns
+    -------
+    stmt: the statement with the profile's loader options
+    """
+    return stmt.options(*loading_options(profile))
+
+
+class NPlusOneError(Exception):
+    """Raised when N_PLUS_ONE_RAISE is set and a relationship is lazy loaded repeatedly in one request."""
+
+
+def record_lazy_load(orm_execute_state):
+    """do_orm_execute listener that counts the lazy loads of each relationship in the current request."""
+    # Relationship loads by selectinload have no lazy_loaded_from, only lazy loads are counted
+    if not has_request_context() or orm_execute_state.lazy_loaded_from is None:
+        return
+    relationship = str(orm_execute_state.loader_strategy_path[-1])
+    if 'lazy_loads' not in g:
+        g.lazy_loads = Counter()
+    g.lazy_loads[relationship] += 1
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 3)
+    if g.lazy_loads[relationship] == threshold:
+        profile = PROFILE_FOR_RELATIONSHIP.get(relationship)
+        hint = f', load it with the "{profile}" loading profile' if profile else ''
+        message = f'Possible N+1 queries in {request.endpoint}: {relationship} lazy loaded {threshold} times{hint}'
+        if current_app.config.get('N_PLUS_ONE_RAISE'):
+            raise NPlusOneError(message)
+        print(message)
+
+
+def report_lazy_loads(response):
+    """after_request function that prints the total lazy loads of each repeatedly loaded relationship."""
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 3)
+    for relationship, count in g.get('lazy_loads', Counter()).items():
+        if count > threshold:
+            print(f'{request.endpoint} lazy loaded {relationship} {count} times')
+    return response
+
+
+def init_n_plus_one_detector(app):
+    """Add the N+1 detector to the app in debug mode or if DETECT_N_PLUS_ONE is set in the config."""
+    if not app.config.get('DETECT_N_PLUS_ONE', app.debug):
+        return
+    # db.session is a scoped_session, listening on it applies to every session it creates
+    if not event.contains(db.session, 'do_orm_execute', record_lazy_load):
+        event.listen(db.session, 'do_orm_execute', record_lazy_load)
+    app.after_request(report_lazy_loads)
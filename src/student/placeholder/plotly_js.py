@@ -0,0 +1,71 @@
+"""
+Serves plotly.js as a static file so chart responses only contain the chart.
+
+By default the line_chart functions in figures_sqlite3.py and figures_sqlalchemy.py include plotly.js, which is
+several megabytes, in the html of every chart. Instead the page can load plotly.js once from the app's static folder:
+
+1. Call init_plotly_js(app) when the app is created, e.g. in create_app(). It writes the file from the installed plotly
+   package if it is not already in the static folder.
+2. Add the script to the <head> of the template that shows the chart, or of the base template:
+
+    <script src="{{ plotly_js_url() }}"></script>
+
+3. Create the chart with line_chart(feature, db, include_plotlyjs=False).
+
+The file name includes the plotly version, e.g. js/plotly-5.24.1.min.js, so the browser can cache it for a year and a
+new version of plotly is fetched under a new name.
+"""
+import os
+from pathlib import Path
+
+import plotly
+from flask import url_for
+from plotly.offline import get_plotlyjs
+
+# Path in the static folder, versioned so it can be cached indefinitely
+PLOTLY_JS_FILENAME = f'js/plotly-{plotly.__version__}.min.js'
+
+# One year in seconds, the longest time browsers will cache a file for
+PLOTLY_JS_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def write_plotly_js(static_folder):
+    """Write plotly.js to the static folder if it is not there already.
+
+    Parameters
+    ----------
+    static_folder: path to the app's static folder
+
+    Returns
+    -------
+    path: Path of plotly.js
+    """
+    path = Path(static_folder, PLOTLY_JS_FILENAME)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so a request never gets a partly written file
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(get_plotlyjs(), encoding='utf8')
+        os.replace(tmp_path, path)
+    return path
+
+
+def plotly_js_url():
+    """Return the URL of the static copy of plotly.js."""
+    return url_for('static', filename=PLOTLY_JS_FILENAME)
+
+
+def init_plotly_js(app):
+    """Write plotly.js to the app's static folder, cache it for a year and add plotly_js_url() to the templates."""
+    write_plotly_js(app.static_folder)
+
+    get_send_file_max_age = app.get_send_file_max_age
+
+    def send_file_max_age(filename):
+        # Only the versioned plotly.js is cached for a year, other static files keep the app's setting
+        if filename == PLOTLY_JS_FILENAME:
+            return PLOTLY_JS_MAX_AGE
+        return get_send_file_max_age(filename)
+
+    app.get_send_file_max_age = send_file_max_age
+    app.jinja_env.globals['plotly_js_url'] = plotly_js_url
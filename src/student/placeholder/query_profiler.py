@@ -0,0 +1,268 @@
+"""
+Records how long each SQL statement takes, how many rows it returns and how many queries each request makes.
+
+get_db() in db.py opens its connection with ProfiledConnection, which times every statement run through the connection
+or its cursors. A statement is timed from when it is executed until its rows have all been fetched, or the cursor is
+used for another statement, so the time includes reading the rows.
+
+Everything is kept in memory with a fixed size: a histogram of latencies for each of the most recently used
+statements, a histogram of the number of queries made by each route and a list of the most recent slow queries.
+
+Config keys:
+    SLOW_QUERY_MS: statements that take longer than this are printed and added to the slow query list, default 100
+    DEBUG_QUERIES_VIEW: True to add the /debug/queries page, it is always added when the app is in debug mode
+
+Use in place of the print based trace_callback, which printed every statement but gave no timings.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import Blueprint, current_app, g, has_request_context, jsonify, request
+
+# Upper bound of each histogram bucket in milliseconds, the last bucket is for anything slower
+LATENCY_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+
+# Upper bound of each histogram bucket for the number of queries made by a request
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+
+
+class Histogram:
+    """ Count of values in fixed buckets, with the total and maximum.
+
+    Attributes:
+        buckets (list): Upper bound of each bucket, values above the last bound are counted in an extra bucket.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        """ Add a value to the histogram. """
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        """ Return the histogram as a dictionary that can be converted to JSON. """
+        labels = [f'<={bound}' for bound in self.buckets] + [f'>{self.buckets[-1]}']
+        return {
+            'count': self.count,
+            'total': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            # A list rather than a dictionary so the buckets stay in order when converted to JSON
+            'buckets': [[label, count] for label, count in zip(labels, self.counts)],
+        }
+
+
+class QueryProfiler:
+    """ Thread-safe store of the query statistics for one app.
+
+    Attributes:
+        slow_query_ms (float): Statements slower than this are logged.
+        max_statements (int): Number of distinct statements to keep statistics for, least recently run are removed.
+    """
+
+    def __init__(self, slow_query_ms=100, max_statements=200, max_slow_queries=50):
+        self.slow_query_ms = slow_query_ms
+        self.max_statements = max_statements
+        self._statements = OrderedDict()
+        self._routes = {}
+        self._slow_queries = deque(maxlen=max_slow_queries)
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows):
+        """ Record one statement.
+
+        Parameters
+        sql: str the SQL statement
+        seconds: float time taken to run the statement and fetch its rows
+        rows: int number of rows returned, or changed for INSERT, UPDATE and DELETE
+        """
+        ms = seconds * 1000
+        # The same statement is often written over several lines, so compare with the whitespace collapsed
+        statement = ' '.join(sql.split())
+        route = request.endpoint if has_request_context() else None
+        with self._lock:
+            stats = self._statements.pop(statement, None)
+            if stats is None:
+                stats = {'latency_ms': Histogram(LATENCY_BUCKETS_MS), 'rows': 0}
+                if len(self._statements) >= self.max_statements:
+                    self._statements.popitem(last=False)
+            self._statements[statement] = stats
+            stats['latency_ms'].add(ms)
+            stats['rows'] += max(rows, 0)
+            if ms > self.slow_query_ms:
+                self._slow_queries.append({'time': time.time(), 'ms': round(ms, 3), 'route': route,
+                                           'sql': statement, 'rows': rows})
+
+        if ms > self.slow_query_ms:
+            print(f'Slow query ({ms:.1f} ms, {rows} rows) in {route}: {statement}')
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+            g.query_ms = g.get('query_ms', 0) + ms
+
+    def record_request(self, route, query_count):
+        """ Record the number of queries a request made. """
+        with self._lock:
+            if route not in self._routes:
+                self._routes[route] = Histogram(QUERY_COUNT_BUCKETS)
+            self._routes[route].add(query_count)
+
+    def report(self):
+        """ Return the statistics as a dictionary that can be converted to JSON, slowest statements first. """
+        with self._lock:
+            statements = [{'sql': sql, 'rows': stats['rows'], 'latency_ms': stats['latency_ms'].to_dict()}
+                          for sql, stats in self._statements.items()]
+            routes = {route: histogram.to_dict() for route, histogram in self._routes.items()}
+            slow_queries = list(self._slow_queries)
+        statements.sort(key=lambda s: s['latency_ms']['total'], reverse=True)
+        return {
+            'slow_query_ms': self.slow_query_ms,
+            'statements': statements,
+            'queries_per_request': routes,
+            'slow_queries': slow_queries,
+        }
+
+    def reset(self):
+        """ Remove all the statistics. """
+        with self._lock:
+            self._statements.clear()
+            self._routes.clear()
+            self._slow_queries.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """ sqlite3 cursor that records each statement it runs with the profiler of its connection. """
+
+    _pending = None
+
+    def _start(self, sql, run, *args):
+        """ Run a statement and start timing it. """
+        self._finish()
+        start = time.perf_counter()
+        result = run(*args)
+        # [sql, seconds, rows]
+        self._pending = [sql, time.perf_counter() - start, 0]
+        if self.description is None:
+            # Not a query, e.g. an INSERT, so there are no rows to fetch
+            self._pending[2] = self.rowcount
+            self._finish()
+        return result
+
+    def _fetched(self, fetch, *args, done=False):
+        """ Fetch rows and add the time and number of rows to the current statement. """
+        start = time.perf_counter()
+        try:
+            rows = fetch(*args)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - start
+            if isinstance(rows, list):
+                self._pending[2] += len(rows)
+                done = done or not rows
+            elif rows is None:
+                done = True
+            else:
+                self._pending[2] += 1
+            if done:
+                self._finish()
+        return rows
+
+    def _finish(self):
+        """ Record the current statement, if there is one. """
+        if self._pending is not None:
+            sql, seconds, rows = self._pending
+            self._pending = None
+            # The profiler is set after the connection is opened, so any statement run before that is not recorded
+            if self.connection.profiler is not None:
+                self.connection.profiler.record(sql, seconds, rows)
+
+    def execute(self, sql, parameters=(), /):
+        return self._start(sql, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self._start(sql, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script, /):
+        return self._start(sql_script, super().executescript, sql_script)
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall, done=True)
+
+    def __next__(self):
+        return self._fetched(super().__next__)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # A statement whose rows were not all fetched is recorded when its cursor is no longer used
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """ sqlite3 connection whose statements are recorded by a QueryProfiler.
+
+    Pass as the factory argument of sqlite3.connect() and then set the profiler attribute.
+    """
+
+    profiler = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # The connection shortcuts do not call cursor(), so they are replaced to use a ProfiledCursor
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script, /):
+        return self.cursor().executescript(sql_script)
+
+
+debug_bp = Blueprint('debug', __name__)
+
+
+@debug_bp.route('/debug/queries')
+def debug_queries():
+    """ Show the query statistics as JSON. """
+    return jsonify(current_app.extensions['query_profiler'].report())
+
+
+def record_request_queries(response):
+    """ after_request function that records the number of queries made by the request. """
+    profiler = current_app.extensions['query_profiler']
+    profiler.record_request(request.endpoint, g.get('query_count', 0))
+    return response
+
+
+def init_profiler(app):
+    """ Add a profiler to the app, and the /debug/queries page in debug mode or if DEBUG_QUERIES_VIEW is set. """
+    app.extensions['query_profiler'] = QueryProfiler(slow_query_ms=app.config.get('SLOW_QUERY_MS', 100))
+    app.after_request(record_request_queries)
+    if app.debug or app.config.get('DEBUG_QUERIES_VIEW'):
+        app.register_blueprint(debug_bp)
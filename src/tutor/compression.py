@@ -0,0 +1,305 @@
+"""
+gzip and brotli compression of the responses from a Flask app or a Dash app.
+
+The chart HTML from line_chart() and the figure JSON returned by the Dash callbacks are large and compress to a small
+fraction of their size. After each request, a response is compressed if the browser accepts it (Accept-Encoding), its
+type is in COMPRESS_MIMETYPES and it is at least COMPRESS_MIN_SIZE bytes.
+
+Files in the static folders are compressed once instead of with every request. When the app starts, a .gz copy, and a
+.br copy if brotli is installed, of each static file that can be compressed is written to the folder COMPRESS_CACHE_DIR,
+e.g. plotly-5.24.1.min.js.gz. The static folders themselves are not changed. A request for the file is answered with
+the compressed copy.
+
+    # Flask, after init_plotly_js(app) so plotly.js is compressed too
+    init_compression(app)
+
+    # Dash, compresses the callbacks and the files in the assets folder
+    init_dash_compression(app)
+
+brotli compresses better than gzip but needs the brotli package: `pip install brotli`. Without it only gzip is used.
+
+Config keys, set in the Flask app config (app.server.config for Dash):
+    COMPRESS_MIN_SIZE: responses smaller than this many bytes are not compressed, default 500
+    COMPRESS_MIMETYPES: the types of response to compress, default COMPRESS_MIMETYPES below
+    COMPRESS_LEVEL: gzip level from 1 to 9, default 6
+    COMPRESS_BR_LEVEL: brotli quality from 0 to 11, default 4
+    COMPRESS_STATIC: write and serve the compressed copies of the static files, default True
+    COMPRESS_CACHE_DIR: folder for the compressed copies of the static files, default tutor-compressed in the system
+        temporary folder
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+
+from flask import current_app, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Text types compress well, images such as .png are already compressed
+COMPRESS_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+COMPRESS_MIN_SIZE = 500
+
+# The extension of the compressed copy of a static file for each encoding
+STATIC_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+COMPRESS_CACHE_DIR = Path(tempfile.gettempdir()) / 'tutor-compressed'
+
+
+def encodings():
+    """Return the encodings that can be used, best first."""
+    return ['br', 'gzip'] if HAS_BROTLI else ['gzip']
+
+
+def accepted_encoding():
+    """Return the best encoding accepted by the browser for the current request, or None."""
+    encoding = request.accept_encodings.best_match(encodings())
+    # best_match returns the first encoding when the browser sends Accept-Encoding: *
+    if encoding is None or request.accept_encodings[encoding] == 0:
+        return None
+    return encoding
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with gzip or brotli.
+
+    Parameters
+    ----------
+    data: bytes to compress
+    encoding: 'gzip' or 'br'
+    level: gzip level or brotli quality, None for the highest
+
+    Returns
+    -------
+    compressed: bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    # mtime=0 so the same data always gives the same bytes
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+def should_compress(path, mimetypes_allowed, min_size):
+    """Return True if a static file is of a type that compresses and is large enough to be worth it."""
+    mimetype, _ = mimetypes.guess_type(path)
+    return mimetype in mimetypes_allowed and os.path.getsize(path) >= min_size
+
+
+def compressed_folder(cache_dir, folder):
+    """Return the folder in cache_dir for the compressed copies of the files in a static folder.
+
+    Each static folder has its own folder, named from a hash of its path, so apps with static files of the same name
+    can share cache_dir.
+    """
+    key = hashlib.sha256(str(Path(folder).resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir) / f'{Path(folder).name}-{key}'
+
+
+def precompress_static(folder, compressed_dir, mimetypes_allowed=COMPRESS_MIMETYPES, min_size=COMPRESS_MIN_SIZE):
+    """Write a compressed copy for each encoding of the files in a static folder to compressed_dir.
+
+    The copies have the same path relative to compressed_dir as the file relative to the static folder. A copy is only
+    written if it is missing or older than the file, so this is quick when the files have not changed.
+
+    Parameters
+    ----------
+    folder: path to the static folder
+    compressed_dir: path to the folder for the compressed copies, see compressed_folder()
+    mimetypes_allowed: the types of file to compress
+    min_size: files smaller than this many bytes are not compressed
+
+    Returns
+    -------
+    written: list of the Paths of the compressed copies that were written
+    """
+    written = []
+    folder = Path(folder)
+    suffixes = tuple(STATIC_SUFFIXES.values())
+    for path in folder.rglob('*'):
+        # Files that are already compressed, e.g. written here by an earlier version of this module, are skipped
+        if not path.is_file() or path.name.endswith(suffixes + ('.tmp',)):
+            continue
+        if not should_compress(path, mimetypes_allowed, min_size):
+            continue
+        compressed_base = Path(compressed_dir) / path.relative_to(folder)
+        data = None
+        for encoding in encodings():
+            compressed_path = compressed_base.with_name(compressed_base.name + STATIC_SUFFIXES[encoding])
+            if compressed_path.exists() and compressed_path.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            compressed = compress(data, encoding)
+            if len(compressed) >= len(data):
+                continue
+            compressed_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so a request never gets a partly written file
+            tmp_path = compressed_path.with_name(compressed_path.name + '.tmp')
+            tmp_path.write_bytes(compressed)
+            os.replace(tmp_path, compressed_path)
+            written.append(compressed_path)
+    return written
+
+
+def compressed_static_file(path, compressed_base):
+    """Return the path and encoding of the compressed copy of a static file to send for this request, or None.
+
+    Parameters
+    ----------
+    path: path to the static file
+    compressed_base: path of the compressed copies without the extension, e.g. the cache folder / 'app.js'
+
+    Returns
+    -------
+    compressed: tuple of the path to the compressed copy and its encoding, or None
+    """
+    for encoding in encodings():
+        if not request.accept_encodings[encoding]:
+            continue
+        compressed_path = compressed_base + STATIC_SUFFIXES[encoding]
+        try:
+            # An out of date copy is not used, e.g. the file was changed while the app was running
+            if os.stat(compressed_path).st_mtime >= os.stat(path).st_mtime:
+                return compressed_path, encoding
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def send_compressed_static(static_folders, compressed_dirs):
+    """Return a before_request function that sends the compressed copy of a static file when there is one.
+
+    Parameters
+    ----------
+    static_folders: dict of the URL path of each static folder, e.g. '/static', to the folder
+    compressed_dirs: dict of the URL path of each static folder to the folder of its compressed copies
+
+    Returns
+    -------
+    before_request: function that returns the response for a static file, or None to let Flask handle the request
+    """
+
+    def before_request():
+        if request.method not in ('GET', 'HEAD') or not current_app.config.get('COMPRESS_STATIC', True):
+            return None
+        for url_path, folder in static_folders.items():
+            if not request.path.startswith(url_path.rstrip('/') + '/'):
+                continue
+            filename = request.path[len(url_path.rstrip('/')) + 1:]
+            path = safe_join(folder, filename)
+            if path is None or not os.path.isfile(path):
+                return None
+            compressed_base = safe_join(compressed_dirs[url_path], filename)
+            if compressed_base is None:
+                return None
+            compressed = compressed_static_file(path, compressed_base)
+            if compressed is None:
+                return None
+            compressed_path, encoding = compressed
+            response = send_file(compressed_path, mimetype=mimetypes.guess_type(path)[0], conditional=True,
+                                 max_age=current_app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+        return None
+
+    return before_request
+
+
+def compress_response(response):
+    """after_request function that compresses the response if the browser accepts it, see the module docstring."""
+    config = current_app.config
+    if response.mimetype not in config.get('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES):
+        return response
+    # The response differs by Accept-Encoding even when this one is not compressed, so caches must store both
+    response.vary.add('Accept-Encoding')
+
+    if (request.method == 'HEAD' or response.status_code != 200 or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    if response.is_streamed and not response.direct_passthrough:
+        # A streamed response is sent while it is made, it cannot be compressed as a whole
+        return response
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+
+    # A file sent with send_file is read so it can be compressed
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE):
+        return response
+    level = config.get('COMPRESS_BR_LEVEL', 4) if encoding == 'br' else config.get('COMPRESS_LEVEL', 6)
+    response.set_data(compress(data, encoding, level))
+    response.headers['Content-Encoding'] = encoding
+
+    # A strong ETag means identical bytes, which the compressed response no longer is. A weak ETag still matches
+    # If-None-Match, so the browser gets 304 Not Modified as before.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app, static_folders=None):
+    """Compress the responses of a Flask app and serve compressed copies of its static files.
+
+    Parameters
+    ----------
+    app: Flask app
+    static_folders: dict of the URL path of each static folder to the folder, default the app's static folder
+    """
+    if static_folders is None:
+        static_folders = {}
+        if app.has_static_folder:
+            static_folders[app.static_url_path] = app.static_folder
+    static_folders = {url_path: folder for url_path, folder in static_folders.items() if os.path.isdir(folder)}
+
+    if app.config.get('COMPRESS_STATIC', True):
+        cache_dir = app.config.get('COMPRESS_CACHE_DIR', COMPRESS_CACHE_DIR)
+        compressed_dirs = {url_path: str(compressed_folder(cache_dir, folder))
+                           for url_path, folder in static_folders.items()}
+        for url_path, folder in static_folders.items():
+            try:
+                precompress_static(folder, compressed_dirs[url_path],
+                                   app.config.get('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES),
+                                   app.config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE))
+            except OSError as e:
+                # e.g. the folder cannot be written, the files are compressed with each request instead
+                print(f'Could not write the compressed copies of the static files in {folder}. Error: {e}')
+        app.before_request(send_compressed_static(static_folders, compressed_dirs))
+    app.after_request(compress_response)
+
+
+def init_dash_compression(dash_app):
+    """Compress the responses of a Dash app, including the callbacks, and serve compressed copies of its assets.
+
+    Parameters
+    ----------
+    dash_app: Dash app
+    """
+    server = dash_app.server
+    static_folders = {}
+    if server.has_static_folder:
+        static_folders[server.static_url_path] = server.static_folder
+    # Dash serves the assets folder at requests_pathname_prefix + assets_url_path
+    assets_url_path = dash_app.config.routes_pathname_prefix + dash_app.config.assets_url_path.lstrip('/')
+    static_folders[assets_url_path] = dash_app.config.assets_folder
+    init_compression(server, static_folders)
@@ -2,7 +2,12 @@ import dash
 import dash_bootstrap_components as dbc
 from dash import Dash, html
 
+from tutor.compression import init_dash_compression
+from tutor.dash_single_t import settings
+
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], use_pages=True)
+if settings.COMPRESS:
+    init_dash_compression(app)
 
 navbar = dbc.NavbarSimple(
     children=[
@@ -0,0 +1,73 @@
+// Clientside callbacks for paralympics_dash_3.py, Dash loads every .js file in the assets folder automatically.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    paralympics: {
+        // Render the event card for the map marker under the mouse using the data in the event-card-data store.
+        // This builds the same components as create_card() in figures.py.
+        render_card: function (hoverData, events) {
+            if (!hoverData || !events) {
+                return window.dash_clientside.no_update;
+            }
+            const hostYear = hoverData.points[0].hovertext;
+            const ev = events[hostYear];
+            if (!ev) {
+                return {
+                    namespace: "dash_bootstrap_components", type: "Alert",
+                    props: {children: "Event not found", color: "danger"}
+                };
+            }
+            const text = (children) => ({
+                namespace: "dash_html_components", type: "P", props: {children: children, className: "card-text"}
+            });
+            return {
+                namespace: "dash_bootstrap_components", type: "Card",
+                props: {
+                    style: {width: "18rem"},
+                    children: [
+                        {
+                            namespace: "dash_bootstrap_components", type: "CardImg",
+                            props: {src: ev.logo, style: {"max-width": "60px"}, top: true}
+                        },
+                        {
+                            namespace: "dash_bootstrap_components", type: "CardBody",
+                            props: {
+                                children: [
+                                    {
+                                        namespace: "dash_html_components", type: "H4",
+                                        props: {children: hostYear, className: "card-title", id: "card-title"}
+                                    },
+                                    text(`${ev.participants} athletes`),
+                                    text(`${ev.events} events`),
+                                    text(`${ev.countries} participating teams`),
+                                    text(`${ev.sports} sports`),
+                                ]
+                            }
+                        },
+                    ]
+                }
+            };
+        },
+
+        // Switch the line chart to a different feature using the data in the line-chart-data store.
+        // Only the y values, hover text and titles change, the rest of the current figure is reused.
+        switch_line_chart: function (feature, series, figure) {
+            if (!feature || !series || !figure || !series.features.includes(feature)) {
+                return window.dash_clientside.no_update;
+            }
+            const data = figure.data.map((trace) => {
+                const values = series.traces[trace.name];
+                return Object.assign({}, trace, {
+                    x: values.year,
+                    y: values[feature],
+                    hovertemplate: trace.hovertemplate.replace(/<br>[^<]*=%\{y\}/, `<br>${feature}=%{y}`),
+                });
+            });
+            const layout = Object.assign({}, figure.layout, {
+                title: Object.assign({}, figure.layout.title, {text: `How has the number of ${feature} changed over time?`}),
+                yaxis: Object.assign({}, figure.layout.yaxis, {
+                    title: Object.assign({}, figure.layout.yaxis.title, {text: feature}),
+                }),
+            });
+            return Object.assign({}, figure, {data: data, layout: layout});
+        }
+    }
+});
@@ -0,0 +1,77 @@
+"""
+Shared, process-wide cache for the paralympics.csv data used by the Dash figures.
+
+The CSV is parsed once and the parsed DataFrame is reused by every callback. The cache is invalidated when the
+file's modification time or size changes, so editing the data file while the app is running is still picked up.
+"""
+import threading
+from importlib import resources
+
+import pandas as pd
+
+from tutor.data.file_version import file_version
+
+
+class CsvDataset:
+    """ Thread-safe loader that parses a CSV file once and reloads it only when the file changes.
+
+    Attributes:
+        path (str): Path to the CSV file.
+        version (tuple): file_version() of the file when it was last parsed, None until first loaded.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.version = None
+        # (DataFrame, version) pair, replaced as a single object so readers never see a mismatched pair
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """ Parse the file if it has not been parsed yet or has changed since it was parsed.
+
+        Returns
+        df: the cached DataFrame
+        version: the file_version() the DataFrame was parsed from
+        """
+        current_version = file_version(self.path)
+        entry = self._entry
+        if entry is not None and entry[1] == current_version:
+            return entry
+        with self._lock:
+            # Another thread may have reloaded the file while this one was waiting for the lock
+            if self._entry is None or self._entry[1] != current_version:
+                self._entry = (pd.read_csv(self.path), current_version)
+                self.version = current_version
+            return self._entry
+
+    def get_dataframe(self, columns=None):
+        """ Get the data, parsing the file only if needed.
+
+        The returned DataFrame is a copy, so callers can add, drop or sort columns without changing the cached data.
+
+        Parameters
+        columns: optional list of column names to return, all columns are returned if None
+
+        Returns
+        df: pandas DataFrame
+        """
+        df, _ = self._load()
+        if columns is not None:
+            df = df.loc[:, columns]
+        return df.copy()
+
+    def get_version(self):
+        """ Return the version of the data, reloading the file first if it has changed. """
+        _, version = self._load()
+        return version
+
+    def clear(self):
+        """ Drop the cached data so the next request parses the file again. """
+        with self._lock:
+            self._entry = None
+            self.version = None
+
+
+# Single shared instance used by the figure functions
+paralympics_csv = CsvDataset(resources.files("tutor.data").joinpath("paralympics.csv"))
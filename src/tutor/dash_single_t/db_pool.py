@@ -0,0 +1,155 @@
+"""
+Small pool of reusable SQLite connections for the Dash figure functions.
+
+Connections are created on demand up to the pool size, checked with a cheap query before they are handed out, and
+returned to the pool instead of being closed. A thread that borrows a connection while it already holds one gets the
+same connection back, and idle connections are reused most-recently-returned first so a busy worker thread keeps
+using the same warm connection.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from tutor.data.read_only import connect_read_only
+
+
+class ConnectionPool:
+    """ Thread-safe pool of sqlite3 connections to one database file.
+
+    Attributes:
+        path (str): Path to the SQLite database file.
+        size (int): Maximum number of open connections.
+        timeout (float): Seconds to wait for a connection when all are in use.
+        read_only (bool): Open the connections read only, see tutor.data.read_only.
+        replica (MemoryReplica): Connect to this in-memory copy of the database instead of the file, see
+            tutor.data.memory_replica. Connections to an out of date copy are replaced when they are next borrowed.
+    """
+
+    def __init__(self, path, size=4, timeout=5.0, read_only=False, replica=None):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.path = str(path)
+        self.size = size
+        self.timeout = timeout
+        self.read_only = read_only
+        self.replica = replica
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats = {"borrowed": 0, "reused": 0, "created": 0, "waits": 0, "failed_health_checks": 0,
+                       "stale": 0}
+
+    def _connect(self):
+        """ Open a new connection to the database. """
+        # Connections move between threads when they are returned to the pool
+        if self.replica is not None:
+            return self.replica.connect(check_same_thread=False)
+        if self.read_only:
+            return connect_read_only(self.path, check_same_thread=False)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        """ Return True if the connection can still run a query. """
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _acquire(self):
+        """ Take an idle connection from the pool, or open a new one if the pool is not full. """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError("Timed out waiting for a connection from the pool")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                conn = None
+                # Reserve the slot now so other threads cannot exceed the pool size while this one connects
+                self._open += 1
+            self._stats["borrowed"] += 1
+
+        if conn is not None and self.replica is not None and not self.replica.is_current(conn):
+            # The database file has changed since this connection's copy was made
+            with self._cond:
+                self._stats["stale"] += 1
+            conn.close()
+            conn = None
+
+        if conn is not None:
+            if self._is_healthy(conn):
+                with self._cond:
+                    self._stats["reused"] += 1
+                return conn
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+            conn.close()
+
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _release(self, conn):
+        """ Return a connection to the pool. """
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """ Borrow a connection for the duration of a with block.
+
+        Usage:
+            with pool.connection() as conn:
+                conn.execute(...)
+
+        Returns
+        conn: sqlite3.Connection
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            # Nested use in the same thread shares the connection the thread already holds
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def stats(self):
+        """ Return the pool statistics as a dictionary. """
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self.size, open=self._open, idle=len(self._idle), in_use=self._open - len(self._idle))
+        return stats
+
+    def close_all(self):
+        """ Close the idle connections, e.g. when the app shuts down. """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,91 @@
+"""
+In-memory index of the event statistics shown on the map hover card.
+
+The index is built with a single query and is rebuilt only when the database file changes, so a hover lookup is a
+dictionary access with no SQL or pandas work.
+"""
+import threading
+
+from tutor.data.event_summary import has_event_summary
+from tutor.data.file_version import file_version
+
+
+class EventIndex:
+    """ Thread-safe mapping of "Host Year" (e.g. "Sydney 2000") to the statistics for that event.
+
+    Attributes:
+        pool (ConnectionPool): Pool used to borrow a connection when the index is (re)built.
+        version (tuple): file_version() of the database when the index was built, None until first built.
+    """
+
+    sql = '''
+        SELECT host.host, event.year, event.participants, event.events, event.countries, event.sports FROM event
+        JOIN host_event ON event.event_id = host_event.event_id
+        JOIN host ON host_event.host_id = host.host_id
+        '''
+
+    # Used instead of sql when the database has the event_summary table, see tutor.data.event_summary
+    summary_sql = '''
+        SELECT host, year, participants, events, countries, sports FROM event_summary WHERE host IS NOT NULL
+        '''
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.version = None
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _build(self):
+        """ Query the database and replace the index. Must be called holding the lock. """
+        version = file_version(self.pool.path)
+        with self.pool.connection() as conn:
+            rows = conn.execute(self.summary_sql if has_event_summary(conn) else self.sql).fetchall()
+        events = {}
+        for host, year, participants, events_count, countries, sports in rows:
+            events[f"{host} {year}"] = {
+                "host": host,
+                "year": year,
+                "logo": f"logos/{year}_{host}.jpg",
+                "participants": participants,
+                "events": events_count,
+                "countries": countries,
+                "sports": sports,
+            }
+        # Replace the whole dictionary so readers never see a partly built index
+        self._events = events
+        self.version = version
+
+    def refresh(self):
+        """ Rebuild the index from the database. """
+        with self._lock:
+            self._build()
+
+    def _ensure_current(self):
+        """ Build the index if it has not been built or the database file has changed since it was built. """
+        if self.version != file_version(self.pool.path):
+            with self._lock:
+                # Another thread may have rebuilt the index while this one was waiting for the lock
+                if self.version != file_version(self.pool.path):
+                    self._build()
+
+    def get(self, host_year):
+        """ Return the statistics for an event.
+
+        Parameters
+        host_year: str host city name followed by a space then the year, e.g. "Sydney 2000"
+
+        Returns
+        event: dict of statistics for the event, or None if there is no such event
+        """
+        self._ensure_current()
+        return self._events.get(host_year)
+
+    def all(self):
+        """ Return a dictionary of the statistics for every event, keyed by "Host Year". """
+        self._ensure_current()
+        return dict(self._events)
+
+    def get_version(self):
+        """ Return the version of the database the index was built from, rebuilding the index first if it changed. """
+        self._ensure_current()
+        return self.version
@@ -0,0 +1,98 @@
+"""
+Bounded least-recently-used cache for Plotly figures.
+
+Figures are stored as the plain dictionary of their JSON, which can be used as the figure property of a dcc.Graph, so
+a cache hit skips building the figure, validating it and converting it. Dash still serialises the dictionary into the
+callback response.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """ Thread-safe LRU cache of Plotly figures as dictionaries.
+
+    The same dictionary is returned by every hit, so callers must not change it.
+
+    Keys should include everything the figure depends on, e.g. ("line", "sports", data_version), so that a change to
+    the data produces a new key rather than returning a stale figure. Stale entries are then evicted as the least
+    recently used.
+
+    Attributes:
+        maxsize (int): Maximum number of figures held before the least recently used is evicted.
+        hits (int): Number of lookups that found a cached figure.
+        misses (int): Number of lookups that had to build the figure.
+        evictions (int): Number of figures removed to keep the cache within maxsize.
+    """
+
+    def __init__(self, maxsize=32):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, create_figure):
+        """ Return the dictionary for the figure with the given key, building and caching it on a miss.
+
+        Parameters
+        key: hashable key identifying the figure
+        create_figure: function with no parameters that returns a Plotly figure
+
+        Returns
+        fig_dict: dict of the figure's JSON, e.g. {"data": [...], "layout": {...}}
+        """
+        with self._lock:
+            fig_dict = self._figures.get(key)
+            if fig_dict is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig_dict
+            self.misses += 1
+
+        # Build outside the lock so a slow figure does not block lookups for other keys. The round trip through JSON
+        # converts the numpy arrays and Plotly objects to plain lists and dictionaries once, when the figure is built.
+        fig_dict = json.loads(create_figure().to_json())
+
+        with self._lock:
+            self._figures[key] = fig_dict
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+        return fig_dict
+
+    def evict(self, key):
+        """ Remove a figure from the cache.
+
+        Parameters
+        key: key of the figure to remove
+
+        Returns
+        removed: bool True if the figure was in the cache
+        """
+        with self._lock:
+            return self._figures.pop(key, None) is not None
+
+    def clear(self):
+        """ Remove all figures and reset the counters. """
+        with self._lock:
+            self._figures.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """ Return the cache counters as a dictionary. """
+        with self._lock:
+            return {
+                "size": len(self._figures),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -5,17 +5,46 @@ import dash
 import dash_bootstrap_components as dbc
 import pandas as pd
 import plotly.express as px
-from dash import html
+from dash import Patch, html
 
+from tutor.dash_single_t import settings
+from tutor.dash_single_t.dataset import paralympics_csv
+from tutor.dash_single_t.db_pool import ConnectionPool
+from tutor.dash_single_t.event_index import EventIndex
+from tutor.dash_single_t.figure_cache import FigureCache
+from tutor.data.event_summary import has_event_summary
+from tutor.data.memory_replica import MemoryReplica
+from tutor.data.read_only import connect_read_only
 
-def get_database_connection():
+# 4 line chart features and 2 bar chart event types, with room for the previous data version while it ages out
+figure_cache = FigureCache(maxsize=12)
+
+# In-memory copy of the database that the queries use instead of the file, if switched on in settings
+replica = MemoryReplica(resources.files("tutor.data").joinpath("paralympics.db")) if settings.MEMORY_REPLICA else None
+
+# Connections used by the map and card, these are reused rather than opened on every callback
+db_pool = ConnectionPool(resources.files("tutor.data").joinpath("paralympics.db"), size=4,
+                         read_only=settings.READ_ONLY_DB, replica=replica)
+
+# Event statistics for the hover card, built once and rebuilt only when the database changes
+event_index = EventIndex(db_pool)
+
+
+def get_database_connection(read_only=settings.READ_ONLY_DB):
     """
     Create a connection to the SQLite database.
 
+    Parameters:
+    read_only: True to open the database read only, see tutor.data.read_only
+
     Returns:
     conn: sqlite3.Connection object
     """
+    if replica is not None:
+        return replica.connect()
     path_db = resources.files("tutor.data").joinpath("paralympics.db")
+    if read_only:
+        return connect_read_only(path_db)
     conn = sqlite3.connect(str(path_db))
     with conn:
         conn.execute("PRAGMA foreign_keys = ON")
@@ -44,10 +73,9 @@ def create_line_chart(feature):
         # Make sure it is lowercase to match the dataframe column names
         feature = feature.lower()
 
-    # Read the data from .csv into a DataFrame
+    # Get the data from the shared dataset, the .csv is only parsed again if the file has changed
     cols = ["type", "year", "host", feature]
-    csv_path = resources.files("tutor.data").joinpath("paralympics.csv")
-    line_chart_data = pd.read_csv(str(csv_path), usecols=cols)
+    line_chart_data = paralympics_csv.get_dataframe(cols)
 
     # Create a Plotly Express line chart with the following parameters
     #  line_chart_data is the DataFrame
@@ -77,8 +105,7 @@ def create_bar_chart(event_type):
     fig: Plotly Express bar chart
     """
     cols = ['type', 'year', 'host', 'participants_m', 'participants_f', 'participants']
-    csv_path = resources.files("tutor.data").joinpath("paralympics.csv")
-    df_events = pd.read_csv(str(csv_path), usecols=cols)
+    df_events = paralympics_csv.get_dataframe(cols)
     # Drop Rome as there is no male/female data
     # Drop rows where male/female data is missing
     df_events = df_events.dropna(subset=['participants_m', 'participants_f'])
@@ -107,10 +134,87 @@ def create_bar_chart(event_type):
     return fig
 
 
-def create_scatter_geo():
-    # create database connection using the get_database_connection function in this file
-    connection = get_database_connection()
+def cached_line_chart(feature):
+    """ Returns the line chart for feature as a dictionary that can be used as the figure property of a dcc.Graph.
+
+    The figure is cached, the cache key includes the version of the .csv file so the chart is rebuilt if the data
+    changes. The dictionary is shared by every call, do not change it.
+
+     Parameters
+     feature: events, sports, participants or countries
+
+     Returns
+     fig: dict Plotly figure
+    """
+    key = ("line", feature, paralympics_csv.get_version())
+    return figure_cache.get_or_create(key, lambda: create_line_chart(feature))
+
+
+def cached_bar_chart(event_type):
+    """ Returns the bar chart for event_type as a dictionary that can be used as the figure property of a dcc.Graph.
+
+    The figure is cached in the same way as cached_line_chart(), do not change the dictionary.
+
+     Parameters
+     event_type: str winter or summer
+
+     Returns
+     fig: dict Plotly figure
+    """
+    key = ("bar", event_type, paralympics_csv.get_version())
+    return figure_cache.get_or_create(key, lambda: create_bar_chart(event_type))
+
+
+def line_chart_patch(feature):
+    """ Returns a partial update that changes an existing line chart to show a different feature.
+
+    Only the y values and hover text of each trace and the titles are sent. The x values, layout and template are
+    unchanged, so the figure must already have been rendered in full by create_line_chart() or cached_line_chart().
+
+     Parameters
+     feature: events, sports, participants or countries
+
+     Returns
+     patch: dash.Patch for the figure property of the line chart dcc.Graph
+    """
+    fig = cached_line_chart(feature)
+    patch = Patch()
+    for i, trace in enumerate(fig['data']):
+        patch['data'][i]['y'] = trace['y']
+        patch['data'][i]['hovertemplate'] = trace['hovertemplate']
+    patch['layout']['title']['text'] = fig['layout']['title']['text']
+    patch['layout']['yaxis']['title']['text'] = fig['layout']['yaxis']['title']['text']
+    return patch
+
+
+def line_chart_series():
+    """ Returns the data for every line chart feature in a compact columnar format.
+
+    This is sent once to the browser so the clientside callback can switch the line chart between features without a
+    request to the server. The values for each event type are in the same order as the points in the traces created by
+    create_line_chart().
+
+     Returns
+     series: dict {"features": [...], "traces": {type: {"year": [...], feature: [...], ...}}}
+    """
+    features = ["events", "sports", "countries", "participants"]
+    df = paralympics_csv.get_dataframe(["type", "year"] + features)
+    traces = {}
+    for event_type, df_type in df.groupby("type", sort=False):
+        traces[event_type] = {col: df_type[col].tolist() for col in ["year"] + features}
+    return {"features": features, "traces": traces}
+
 
+def line_chart_series_version():
+    """ Returns the version of the data in line_chart_series(), which changes when paralympics.csv changes.
+
+     Returns
+     version: list, so it can be compared with the version stored in a dcc.Store
+    """
+    return list(paralympics_csv.get_version())
+
+
+def create_scatter_geo():
     # define the sql query
     sql = '''
         SELECT event.year, host.host, host.latitude, host.longitude FROM event
@@ -118,8 +222,16 @@ def create_scatter_geo():
         JOIN host on host_event.host_id = host.host_id
         '''
 
-    df_locs = pd.read_sql(sql=sql, con=connection, index_col=None)
-    # The lat and lon are stored as string but need to be floats for the scatter_geo
+    # the event_summary table has the same columns with no join, see tutor.data.event_summary
+    summary_sql = 'SELECT year, host, latitude, longitude FROM event_summary WHERE host IS NOT NULL'
+
+    # borrow a database connection from the pool
+    with db_pool.connection() as connection:
+        if has_event_summary(connection):
+            sql = summary_sql
+        df_locs = pd.read_sql(sql=sql, con=connection, index_col=None)
+    # The lat and lon are stored as string until the database is migrated to schema version 2 (tutor.data.migrations),
+    # they need to be floats for the scatter_geo
     df_locs['longitude'] = df_locs['longitude'].astype(float)
     df_locs['latitude'] = df_locs['latitude'].astype(float)
     # Adds a new column that concatenates the city and year e.g. Barcelona 2012
@@ -144,36 +256,56 @@ def create_card(host_year):
     Returns:
         card: dash boostrap components card for the event
     """
-    # Access substrings to get the year and host as separate values.
-    # The last 4 digits are the year, the 5th from last is a space, and the rest is the host
-    year = host_year[-4:]
-    host = host_year[:-5]
+    # Look up the event statistics in the in-memory index, no database query is needed on the hover path
+    ev = event_index.get(host_year)
+    if ev is None:
+        return dbc.Alert("Event not found", color="danger")
 
-    # Read the data into a DataFrame using a database query
-    conn = get_database_connection()
-    with conn:
-        query = "SELECT * FROM event JOIN  host_event ON event.event_id = host_event.event_id JOIN host ON host_event.host_id = host.host_id WHERE event.year = ? AND host.host = ?;"
-        ev = pd.read_sql_query(query, conn, params=[year, host])
-        if ev.empty:
-            return dbc.Alert("Event not found", color="danger")
-
-        # Variables for the card contents
-        logo = f'logos/{year}_{host}.jpg'
-        participants = f'{ev['participants'].item()} athletes'
-        events = f'{ev['events'].item()} events'
-        countries = f'{ev['countries'].item()} participating teams'
-        sports = f'{ev['sports'].item()} sports'
-
-        card = dbc.Card([
-            dbc.CardImg(src=dash.get_asset_url(logo), style={'max-width': '60px'}, top=True),
-            dbc.CardBody([
-                html.H4(host_year, className="card-title", id='card-title'),
-                html.P(participants, className="card-text", ),
-                html.P(events, className="card-text", ),
-                html.P(countries, className="card-text", ),
-                html.P(sports, className="card-text", ),
-            ]),
-        ],
-            style={"width": "18rem"},
-        )
-        return card
+    # Variables for the card contents
+    participants = f'{ev['participants']} athletes'
+    events = f'{ev['events']} events'
+    countries = f'{ev['countries']} participating teams'
+    sports = f'{ev['sports']} sports'
+
+    card = dbc.Card([
+        dbc.CardImg(src=dash.get_asset_url(ev['logo']), style={'max-width': '60px'}, top=True),
+        dbc.CardBody([
+            html.H4(host_year, className="card-title", id='card-title'),
+            html.P(participants, className="card-text", ),
+            html.P(events, className="card-text", ),
+            html.P(countries, className="card-text", ),
+            html.P(sports, className="card-text", ),
+        ]),
+    ],
+        style={"width": "18rem"},
+    )
+    return card
+
+
+def card_data():
+    """
+    Generate the data needed to render the card for every event in the browser.
+
+    Returns:
+        events: dict keyed by "Host Year" of the card values, with the logo as a URL for the Dash assets folder
+    """
+    events = {}
+    for host_year, ev in event_index.all().items():
+        events[host_year] = {
+            'logo': dash.get_asset_url(ev['logo']),
+            'participants': ev['participants'],
+            'events': ev['events'],
+            'countries': ev['countries'],
+            'sports': ev['sports'],
+        }
+    return events
+
+
+def card_data_version():
+    """
+    Returns the version of the data in card_data(), which changes when the database changes.
+
+    Returns:
+        version: list, so it can be compared with the version stored in a dcc.Store
+    """
+    return list(event_index.get_version())
@@ -0,0 +1,40 @@
+"""
+Deferred construction of values that are expensive to create, such as a Dash layout containing figures.
+"""
+import threading
+
+
+class LazyValue:
+    """ Builds a value the first time it is needed and then returns the same value on every later call. """
+
+    def __init__(self, build):
+        """
+        Parameters
+        build: function with no parameters that returns the value
+        """
+        self._build = build
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """ Return the value, building it if this is the first call.
+
+        Threads that call get() while the value is being built wait for that build rather than starting another.
+        """
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self._build()
+                    self._built = True
+        return self._value
+
+    def warm_up(self):
+        """ Start building the value in a background thread so it is ready, or nearly ready, for the first request.
+
+        Returns
+        thread: the daemon thread that is building the value
+        """
+        thread = threading.Thread(target=self.get, name="layout-warm-up", daemon=True)
+        thread.start()
+        return thread
@@ -1,18 +1,18 @@
+import time
+
 import dash_bootstrap_components as dbc
 from dash import Dash, dcc, html
 
+from tutor.dash_single_t import settings
 from tutor.dash_single_t.figures import create_bar_chart, create_card, create_line_chart, create_scatter_geo
+from tutor.dash_single_t.lazy import LazyValue
 
 meta_tags = [{"name": "viewport", "content": "width=device-width, initial-scale=1"}, ]
 external_stylesheets = [dbc.themes.BOOTSTRAP]
+# Used to report how long it takes to create the app
+start_time = time.perf_counter()
 app = Dash(__name__, external_stylesheets=external_stylesheets, meta_tags=meta_tags)
 
-# Create the figure (chart) variables
-fig_line = create_line_chart("sports")
-fig_bar = create_bar_chart("winter")
-map = create_scatter_geo()
-card = create_card("Sydney 2000")
-
 # Variables that define each row that will be added to the layout
 row_one = dbc.Row([
     dbc.Col([
@@ -45,22 +45,57 @@ row_two = dbc.Row([
     ], width={"size": 4, "offset": 2}),
 ])
 
-row_three = dbc.Row([
-    dbc.Col(children=[dcc.Graph(id="line-chart", figure=fig_line), ], width=6),
-    dbc.Col(children=[dcc.Graph(id="bar-chart", figure=fig_bar), ], width=6),
-], align="start")
 
-row_four = dbc.Row([
-    dbc.Col(children=[dcc.Graph(id='map', figure=map)], width=8),
-    dbc.Col(children=[card], id='card', width=4),
-], align="start")
+def create_layout(figures=True):
+    """ Create the figures and return the layout that contains them.
 
-app.layout = dbc.Container([
-    row_one,
-    row_two,
-    row_three,
-    row_four
-])
+    Parameters
+    figures: False to return the same components, with the same ids, but without building the figures or reading the
+             data. Used as the validation layout in lazy layout mode.
+    """
+    layout_start_time = time.perf_counter()
+    # Create the figure (chart) variables
+    fig_line = create_line_chart("sports") if figures else {}
+    fig_bar = create_bar_chart("winter") if figures else {}
+    map = create_scatter_geo() if figures else {}
+    card = create_card("Sydney 2000") if figures else html.Div()
+
+    row_three = dbc.Row([
+        dbc.Col(children=[dcc.Graph(id="line-chart", figure=fig_line), ], width=6),
+        dbc.Col(children=[dcc.Graph(id="bar-chart", figure=fig_bar), ], width=6),
+    ], align="start")
+
+    row_four = dbc.Row([
+        dbc.Col(children=[dcc.Graph(id='map', figure=map)], width=8),
+        dbc.Col(children=[card], id='card', width=4),
+    ], align="start")
+
+    if figures and settings.REPORT_STARTUP_TIME:
+        print(f"Layout created in {time.perf_counter() - layout_start_time:.3f}s")
+    return dbc.Container([
+        row_one,
+        row_two,
+        row_three,
+        row_four
+    ])
+
+
+if settings.LAZY_LAYOUT:
+    # The figures are built when the first page is requested, or in the background if warm up is on
+    layout = LazyValue(create_layout)
+    # Dash calls a layout function straight away to check it, which would build the figures now, unless it has a
+    # validation layout. The skeleton without the figures is used instead.
+    app.validation_layout = create_layout(figures=False)
+    app.layout = layout.get
+    if settings.WARM_UP_LAYOUT:
+        layout.warm_up()
+else:
+    app.layout = create_layout()
+
+if settings.REPORT_STARTUP_TIME:
+    # Includes building the layout unless LAZY_LAYOUT is set
+    print(f"Dash app created in {time.perf_counter() - start_time:.3f}s "
+          f"(lazy layout: {settings.LAZY_LAYOUT}, warm up: {settings.LAZY_LAYOUT and settings.WARM_UP_LAYOUT})")
 
 if __name__ == '__main__':
     app.run(debug=True)
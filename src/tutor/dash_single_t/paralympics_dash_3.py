@@ -1,18 +1,23 @@
 """ Version as at the end of week 3: Charts with callbacks"""
+import time
+
 import dash_bootstrap_components as dbc
-from dash import Dash, Input, Output, dcc, html
+from dash import ClientsideFunction, Dash, Input, Output, Patch, State, ctx, dcc, html, no_update
 
-from tutor.dash_single_t.figures import create_bar_chart, create_card, create_line_chart, create_scatter_geo
+from tutor.compression import init_dash_compression
+from tutor.dash_single_t import settings
+from tutor.dash_single_t.lazy import LazyValue
+from tutor.dash_single_t.figures import cached_bar_chart, cached_line_chart, card_data, card_data_version, \
+    create_card, create_line_chart, create_scatter_geo, line_chart_patch, line_chart_series, line_chart_series_version
 
 meta_tags = [{"name": "viewport", "content": "width=device-width, initial-scale=1"}, ]
 external_stylesheets = [dbc.themes.BOOTSTRAP]
+# Used to report how long it takes to create the app
+start_time = time.perf_counter()
 app = Dash(__name__, external_stylesheets=external_stylesheets, meta_tags=meta_tags)
-
-# Create the figure (chart) variables
-fig_line = create_line_chart("sports")
-fig_bar = create_bar_chart("winter")
-map = create_scatter_geo()
-card = create_card("Sydney 2000")
+if settings.COMPRESS:
+    # The figure JSON sent by the callbacks is large and compresses well
+    init_dash_compression(app)
 
 # Variables that define each row that will be added to the layout
 row_one = dbc.Row([
@@ -46,64 +51,176 @@ row_two = dbc.Row([
     ], width={"size": 4, "offset": 2}),
 ])
 
-row_three = dbc.Row([
-    dbc.Col(children=[dcc.Graph(id="line-chart", figure=fig_line), ], width=6),
-    dbc.Col(children=[], id='bar-div', width=6),
-], align="start")
-
-row_four = dbc.Row([
-    dbc.Col(children=[dcc.Graph(id='map', figure=map)], width=8),
-    dbc.Col(children=[card], id='card', width=4),
-], align="start")
-
-app.layout = dbc.Container([
-    row_one,
-    row_two,
-    row_three,
-    row_four
-])
-
 
-@app.callback(
-    Output(component_id='line-chart', component_property='figure'),
-    Input(component_id='dropdown-category', component_property='value')
-)
-def update_line_chart(feature):
-    """ Update the line chart based on the dropdown selection """
-    figure = create_line_chart(feature)
-    return figure
+def create_layout(figures=True):
+    """ Create the figures and return the layout that contains them.
+
+    Parameters
+    figures: False to return the same components, with the same ids, but without building the figures or reading the
+             data. Used as the validation layout in lazy layout mode.
+    """
+    layout_start_time = time.perf_counter()
+    # Create the figure (chart) variables. The bar charts are created by the update_bar_chart callback.
+    fig_line = create_line_chart("sports") if figures else {}
+    map = create_scatter_geo() if figures else {}
+    card = create_card("Sydney 2000") if figures else html.Div()
+
+    row_three = dbc.Row([
+        dbc.Col(children=[dcc.Graph(id="line-chart", figure=fig_line), ], width=6),
+        dbc.Col(children=[], id='bar-div', width=6),
+        # The event types that currently have a bar chart in bar-div, in the same order as the charts
+        dcc.Store(id='bar-chart-types'),
+    ], align="start")
+
+    if settings.CLIENTSIDE_LINE_CHART:
+        # The data for every feature is sent once with the page so the line chart can be switched in the browser. The
+        # version is read first, so if the data changes in between it is sent again by refresh_line_chart_data.
+        row_three.children.append(dcc.Store(id='line-chart-data-version', data=line_chart_series_version()))
+        row_three.children.append(dcc.Store(id='line-chart-data', data=line_chart_series()))
+
+    row_four = dbc.Row([
+        dbc.Col(children=[dcc.Graph(id='map', figure=map)], width=8),
+        dbc.Col(children=[card], id='card', width=4),
+    ], align="start")
+
+    if settings.CLIENTSIDE_CARD:
+        # The data for all the event cards is sent once with the page so the card can be rendered in the browser
+        row_four.children.append(dcc.Store(id='event-card-data-version', data=card_data_version()))
+        row_four.children.append(dcc.Store(id='event-card-data', data=card_data()))
+
+    if figures and settings.REPORT_STARTUP_TIME:
+        print(f"Layout created in {time.perf_counter() - layout_start_time:.3f}s")
+    return dbc.Container([
+        row_one,
+        row_two,
+        row_three,
+        row_four
+    ])
+
+
+if settings.LAZY_LAYOUT:
+    # The figures are built when the first page is requested, or in the background if warm up is on
+    layout = LazyValue(create_layout)
+    # Dash calls a layout function straight away to check the callback ids, which would build the figures now, unless
+    # it has a validation layout. The skeleton has the same ids, so the callbacks are still checked.
+    app.validation_layout = create_layout(figures=False)
+    app.layout = layout.get
+    if settings.WARM_UP_LAYOUT:
+        layout.warm_up()
+else:
+    app.layout = create_layout()
+
+if settings.CLIENTSIDE_LINE_CHART:
+    # Switch the feature in the browser using switch_line_chart() in assets/clientside.js. The data is an Input so the
+    # chart is redrawn if refresh_line_chart_data sends newer data.
+    app.clientside_callback(
+        ClientsideFunction(namespace='paralympics', function_name='switch_line_chart'),
+        Output(component_id='line-chart', component_property='figure'),
+        Input(component_id='dropdown-category', component_property='value'),
+        Input(component_id='line-chart-data', component_property='data'),
+        State(component_id='line-chart', component_property='figure'),
+    )
+
+    @app.callback(
+        Output(component_id='line-chart-data', component_property='data'),
+        Input(component_id='line-chart-data-version', component_property='data'),
+    )
+    def refresh_line_chart_data(version):
+        """ Runs when the page loads. The layout is only created once, so send the data again if paralympics.csv has
+        changed since then, otherwise nothing is sent.
+        """
+        if version == line_chart_series_version():
+            return no_update
+        return line_chart_series()
+else:
+    @app.callback(
+        Output(component_id='line-chart', component_property='figure'),
+        Input(component_id='dropdown-category', component_property='value')
+    )
+    def update_line_chart(feature):
+        """ Update the line chart based on the dropdown selection.
+        The full figure is sent on the first render, after that only the changed data and titles are sent.
+        """
+        if ctx.triggered_id is None:
+            return cached_line_chart(feature)
+        return line_chart_patch(feature)
 
 
 # This version removes the original bar chart component from the layout and treats the Col as the Output
 @app.callback(
     Output(component_id='bar-div', component_property='children'),
-    Input(component_id='checklist-games-type', component_property='value')
+    Output(component_id='bar-chart-types', component_property='data'),
+    Input(component_id='checklist-games-type', component_property='value'),
+    State(component_id='bar-chart-types', component_property='data'),
 )
-def update_bar_chart(selected_values):
+def update_bar_chart(selected_values, shown_values):
     """ Updates the bar chart based on the checklist selection.
      Creates one chart for each of the selected values.
+     After the first render only the charts that were added or removed are sent, charts that are still selected
+     are left as they are in the browser.
      """
-    figures = []
-    # Iterate the list of values from the checkbox component
+    if ctx.triggered_id is None or shown_values is None:
+        figures = []
+        # Iterate the list of values from the checkbox component
+        for value in selected_values:
+            fig = cached_bar_chart(value)
+            # Assign id to be used to identify the charts
+            id = f"bar-chart-{value}"
+            element = dcc.Graph(figure=fig, id=id)
+            figures.append(element)
+        return figures, list(selected_values)
+
+    patch = Patch()
+    shown = list(shown_values)
+    # Remove the charts that have been deselected, working backwards so the positions of earlier charts do not change
+    for i in reversed(range(len(shown))):
+        if shown[i] not in selected_values:
+            del patch[i]
+            del shown[i]
+    # Add a chart for each newly selected value
     for value in selected_values:
-        fig = create_bar_chart(value)
-        # Assign id to be used to identify the charts
-        id = f"bar-chart-{value}"
-        element = dcc.Graph(figure=fig, id=id)
-        figures.append(element)
-    return figures
-
-
-@app.callback(
-    Output('card', 'children'),
-    Input('map', 'hoverData'),
-)
-def display_card(hover_data):
-    """ Display a card with information about the selected country on the map """
-    if hover_data is not None:
-        text = hover_data['points'][0]['hovertext']
-        return create_card(text)
-
+        if value not in shown:
+            patch.append(dcc.Graph(figure=cached_bar_chart(value), id=f"bar-chart-{value}"))
+            shown.append(value)
+    return patch, shown
+
+
+if settings.CLIENTSIDE_CARD:
+    # Render the card in the browser using render_card() in assets/clientside.js, so a hover is not sent to the server
+    app.clientside_callback(
+        ClientsideFunction(namespace='paralympics', function_name='render_card'),
+        Output('card', 'children'),
+        Input('map', 'hoverData'),
+        State('event-card-data', 'data'),
+    )
+
+    @app.callback(
+        Output('event-card-data', 'data'),
+        Input('event-card-data-version', 'data'),
+    )
+    def refresh_card_data(version):
+        """ Runs when the page loads. The layout is only created once, so send the card data again if the database has
+        changed since then, otherwise nothing is sent.
+        """
+        if version == card_data_version():
+            return no_update
+        return card_data()
+else:
+    @app.callback(
+        Output('card', 'children'),
+        Input('map', 'hoverData'),
+    )
+    def display_card(hover_data):
+        """ Display a card with information about the selected country on the map """
+        if hover_data is not None:
+            text = hover_data['points'][0]['hovertext']
+            return create_card(text)
+
+
+if settings.REPORT_STARTUP_TIME:
+    # Includes building the layout unless LAZY_LAYOUT is set
+    print(f"Dash app created in {time.perf_counter() - start_time:.3f}s "
+          f"(lazy layout: {settings.LAZY_LAYOUT}, warm up: {settings.LAZY_LAYOUT and settings.WARM_UP_LAYOUT})")
 
 if __name__ == '__main__':
     app.run(debug=True)
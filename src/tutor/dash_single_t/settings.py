@@ -0,0 +1,53 @@
+"""
+Optional modes for the paralympics dashboards.
+
+Each mode is off by default and is switched on by setting the environment variable to 1 before starting the app, e.g.
+PARALYMPICS_CLIENTSIDE_CARD=1 python -m tutor.dash_single_t.paralympics_dash_3
+"""
+import os
+
+
+def env_flag(name, default=False):
+    """ Read a true/false setting from an environment variable.
+
+    Parameters
+    name: str name of the environment variable
+    default: bool value to use if the variable is not set
+
+    Returns
+    flag: bool
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Send the data for every event card once in a dcc.Store and render the hover card in the browser
+CLIENTSIDE_CARD = env_flag("PARALYMPICS_CLIENTSIDE_CARD")
+
+# Send the data for every line chart feature once in a dcc.Store and switch the feature in the browser
+CLIENTSIDE_LINE_CHART = env_flag("PARALYMPICS_CLIENTSIDE_LINE_CHART")
+
+# Build the layout and its figures when the first page is requested instead of when the app module is imported
+LAZY_LAYOUT = env_flag("PARALYMPICS_LAZY_LAYOUT")
+
+# With LAZY_LAYOUT, also start building the layout in a background thread as soon as the app has started. Has no
+# effect without LAZY_LAYOUT.
+WARM_UP_LAYOUT = env_flag("PARALYMPICS_WARM_UP_LAYOUT")
+
+# Print how long it takes to create the app and to build the layout, e.g. to compare startup with and without
+# LAZY_LAYOUT. Printed when the app module is imported, so also when it is run by a WSGI server such as gunicorn.
+REPORT_STARTUP_TIME = env_flag("PARALYMPICS_REPORT_STARTUP_TIME")
+
+# Open paralympics.db read only, with memory-mapped I/O (see tutor.data.read_only). Changes to the file are still seen,
+# so the card and line chart data are refreshed as in the default mode.
+READ_ONLY_DB = env_flag("PARALYMPICS_READ_ONLY_DB")
+
+# Copy paralympics.db into memory when the app starts and run the queries against the copy (see
+# tutor.data.memory_replica). The copy is made again when the file changes.
+MEMORY_REPLICA = env_flag("PARALYMPICS_MEMORY_REPLICA")
+
+# Compress the responses with gzip, or brotli if installed, and serve compressed copies of the assets (see
+# tutor.compression). On by default, set PARALYMPICS_COMPRESS=0 to send the responses uncompressed.
+COMPRESS = env_flag("PARALYMPICS_COMPRESS", default=True)
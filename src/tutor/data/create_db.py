@@ -4,17 +4,24 @@ Contains functions to create the paralympics database without data.
 """
 import sqlite3
 
+from tutor.data import update_db
+from tutor.data.indexes import create_indexes
 from tutor.flask_para_t import add_data
 
 
-def create_db(cursor, connection):
+def create_db(cursor, connection, incremental=False):
     """Create the paralympics database structure and add the data.
 
     Parameters
     ----------
     connection: sqlite connection object
     cursor: sqlite cursor object
+    incremental: if True and the tables already exist, only add the new and changed rows from the spreadsheet using
+                 update_db() instead of dropping and recreating every table. The quiz and student response data is kept.
     """
+    if incremental and cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event'").fetchone():
+        update_db.update_db(cursor, connection)
+        return
 
     # Define the tables and relationships using SQL statements
     disability_sql = '''CREATE TABLE disability (
@@ -156,11 +163,18 @@ def create_db(cursor, connection):
         cursor.execute(student_response_sql)
         cursor.execute(medal_result_sql)
 
+        # Create the secondary indexes, see tutor.data.indexes
+        create_indexes(cursor)
+
         # Commit the changes
         connection.commit()
 
-        # Call the function to add the data
-        add_data.add_all_data(cursor, connection)
+        # Call the function to add the data, it returns the sheets it read
+        sheets = add_data.add_all_data(cursor, connection)
+
+        # Record what was loaded so a later incremental update only writes the rows that have changed. The sheets
+        # already read are used rather than reading the spreadsheet again.
+        update_db.save_fingerprints(cursor, connection, sheets=sheets)
 
     except sqlite3.Error as e:
         print(f'An error occurred creating the database. Error: {e}')
@@ -0,0 +1,130 @@
+"""
+Denormalised summary of each event and its hosts, kept in sync with the source tables by triggers.
+
+The charts, map and hover card all join event to participants or to host_event and host. The event_summary table holds
+the result of those joins, one row for each host of an event, so they can read a single table instead. An event with
+no host has one row with a NULL host.
+
+The table is added by schema version 3 (see tutor.data.migrations). Triggers on event, host_event, host and
+participants recalculate the rows of an event whenever the event or one of the rows it is joined to changes.
+refresh_event_summary() rebuilds the whole table, e.g. after loading data with the triggers dropped.
+
+Readers should check has_event_summary() and fall back to the joins for a database that has not been migrated.
+"""
+from tutor.data.indexes import table_exists
+
+event_summary_sql = '''CREATE TABLE IF NOT EXISTS event_summary (
+                        event_id INTEGER NOT NULL,
+                        host_id INTEGER,
+                        type TEXT,
+                        year INTEGER,
+                        host TEXT,
+                        host_year TEXT,
+                        latitude REAL,
+                        longitude REAL,
+                        countries INTEGER,
+                        events INTEGER,
+                        sports INTEGER,
+                        participants_m INTEGER,
+                        participants_f INTEGER,
+                        participants INTEGER
+                    ) STRICT'''
+
+event_summary_index_sql = '''CREATE INDEX IF NOT EXISTS idx_event_summary_event_id
+                             ON event_summary (event_id)'''
+
+TRIGGER_NAMES = [
+    'event_summary_event_insert', 'event_summary_event_update', 'event_summary_event_delete',
+    'event_summary_host_event_insert', 'event_summary_host_event_update', 'event_summary_host_event_delete',
+    'event_summary_host_update', 'event_summary_participants_insert', 'event_summary_participants_update',
+    'event_summary_participants_delete',
+]
+
+
+def has_column(cursor, table, column):
+    """Return True if the table has the column."""
+    return cursor.execute('SELECT 1 FROM pragma_table_info(?) WHERE name = ?', (table, column)).fetchone() is not None
+
+
+def has_event_summary(connection):
+    """Return True if the database has the event_summary table."""
+    return table_exists(connection.cursor(), 'event_summary')
+
+
+def summary_select_sql(cursor, where):
+    """Return the query that calculates the event_summary rows for the events matching a WHERE clause.
+
+    The paralympics.db in this package has the participants and coordinates in the event and host tables, while the
+    database made by create_db() has a participants table and no coordinates, so the query depends on the schema.
+    """
+    if table_exists(cursor, 'participants'):
+        participants_join = 'LEFT JOIN participants ON participants.event_id = event.event_id'
+        participants = 'participants.participants_m, participants.participants_f, participants.participants'
+    else:
+        participants_join = ''
+        participants = 'event.participants_m, event.participants_f, event.participants'
+    if has_column(cursor, 'host', 'latitude'):
+        coordinates = 'CAST(host.latitude AS REAL), CAST(host.longitude AS REAL)'
+    else:
+        coordinates = 'NULL, NULL'
+
+    return f'''SELECT event.event_id, host.host_id, event.type, event.year, host.host, host.host || ' ' || event.year,
+               {coordinates}, event.countries, event.events, event.sports, {participants}
+               FROM event
+               LEFT JOIN host_event ON event.event_id = host_event.event_id
+               LEFT JOIN host ON host_event.host_id = host.host_id
+               {participants_join}
+               WHERE {where}'''
+
+
+def refresh_sql(cursor, event_ids):
+    """Return the statements that recalculate the event_summary rows of the events in an SQL expression."""
+    return f'''DELETE FROM event_summary WHERE event_id IN ({event_ids});
+               INSERT INTO event_summary {summary_select_sql(cursor, f'event.event_id IN ({event_ids})')};'''
+
+
+def create_event_summary_triggers(cursor):
+    """Create the triggers that keep event_summary in sync with the tables it is calculated from."""
+    for name in TRIGGER_NAMES:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    triggers = [
+        ('event_summary_event_insert', 'AFTER INSERT ON event', refresh_sql(cursor, 'NEW.event_id')),
+        ('event_summary_event_update', 'AFTER UPDATE ON event',
+         refresh_sql(cursor, 'OLD.event_id, NEW.event_id')),
+        ('event_summary_event_delete', 'AFTER DELETE ON event',
+         'DELETE FROM event_summary WHERE event_id = OLD.event_id;'),
+        ('event_summary_host_event_insert', 'AFTER INSERT ON host_event', refresh_sql(cursor, 'NEW.event_id')),
+        ('event_summary_host_event_update', 'AFTER UPDATE ON host_event',
+         refresh_sql(cursor, 'OLD.event_id, NEW.event_id')),
+        ('event_summary_host_event_delete', 'AFTER DELETE ON host_event', refresh_sql(cursor, 'OLD.event_id')),
+        ('event_summary_host_update', 'AFTER UPDATE ON host',
+         refresh_sql(cursor, 'SELECT event_id FROM host_event WHERE host_id IN (OLD.host_id, NEW.host_id)')),
+    ]
+    if table_exists(cursor, 'participants'):
+        triggers += [
+            ('event_summary_participants_insert', 'AFTER INSERT ON participants',
+             refresh_sql(cursor, 'NEW.event_id')),
+            ('event_summary_participants_update', 'AFTER UPDATE ON participants',
+             refresh_sql(cursor, 'OLD.event_id, NEW.event_id')),
+            ('event_summary_participants_delete', 'AFTER DELETE ON participants',
+             refresh_sql(cursor, 'OLD.event_id')),
+        ]
+    # Deleting a host deletes its host_event rows by cascade, which fires the host_event trigger
+
+    for name, event, body in triggers:
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+
+def refresh_event_summary(cursor):
+    """Rebuild every row of event_summary from the source tables. The caller commits."""
+    cursor.execute('DELETE FROM event_summary')
+    cursor.execute(f'INSERT INTO event_summary {summary_select_sql(cursor, "1")}')
+
+
+def create_event_summary(cursor):
+    """Create and fill the event_summary table and its triggers. The caller commits."""
+    cursor.execute(event_summary_sql)
+    cursor.execute(event_summary_index_sql)
+    create_event_summary_triggers(cursor)
+    refresh_event_summary(cursor)
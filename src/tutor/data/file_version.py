@@ -0,0 +1,17 @@
+"""
+Cheap check for changes to a data file, used by the caches that are rebuilt when the file they were read from changes.
+"""
+import os
+
+
+def file_version(path):
+    """ Return a value that changes whenever the file at path changes.
+
+    Parameters
+    path: str or Path to the file
+
+    Returns
+    version: tuple (modification time in nanoseconds, size in bytes)
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,189 @@
+"""
+Secondary indexes for the paralympics database and a check of the query plans of the queries the apps run.
+
+The tables only have primary keys, so looking up an event by year and type, a host by name or the medal results of an
+event reads every row of the table. The indexes below are created with the schema by create_db() and added to an
+existing database by update_db().
+
+Run this module to print the query plan of each known query and flag any full table scan:
+
+    python -m tutor.data.indexes [path/to/paralympics.db]
+
+The exit status is 1 if a query scans a table it is not expected to.
+"""
+import re
+import sqlite3
+import sys
+from importlib import resources
+
+from tutor.data.read_only import read_only_uri
+
+# (index name, table, columns)
+INDEXES = [
+    ('idx_event_year_type', 'event', 'year, type'),
+    ('idx_host_host', 'host', 'host'),
+    ('idx_host_country_code', 'host', 'country_code'),
+    ('idx_country_name', 'country', 'name'),
+    # The primary key of host_event starts with host_id, so it cannot be used to find the hosts of an event
+    ('idx_host_event_event_id', 'host_event', 'event_id'),
+    ('idx_participants_event_id', 'participants', 'event_id'),
+    ('idx_disability_category', 'disability', 'category'),
+    ('idx_disability_event_event_id', 'disability_event', 'event_id'),
+    # Also covers the lookup of a result by event and country. Made unique by schema version 4, see
+    # tutor.data.medal_results
+    ('idx_medal_result_event_id', 'medal_result', 'event_id, country_code'),
+    ('idx_medal_result_country_code', 'medal_result', 'country_code'),
+    ('idx_question_event_id', 'question', 'event_id'),
+    ('idx_answer_choice_question_id', 'answer_choice', 'question_id'),
+    ('idx_quiz_question_quiz_id', 'quiz_question', 'quiz_id'),
+    ('idx_student_response_quiz_id', 'student_response', 'quiz_id'),
+]
+
+# (name, sql, example parameters, tables the query may scan in full)
+# A query that reads every event, e.g. to draw a chart, has to scan one of the tables it joins. The planner chooses
+# which, so each table it could start from is allowed.
+KNOWN_QUERIES = [
+    ('line chart', 'SELECT * FROM event JOIN participants on event.event_id = participants.event_id',
+     (), {'event', 'participants'}),
+    ('map and hover card', '''SELECT event.year, host.host FROM event
+        JOIN host_event ON event.event_id = host_event.event_id
+        JOIN host ON host_event.host_id = host.host_id''',
+     (), {'event', 'host_event'}),
+    ('event by year and type', 'SELECT event_id FROM event WHERE year = ? AND type = ?',
+     (2012, 'summer'), set()),
+    ('host by name', 'SELECT host_id FROM host WHERE host = ?',
+     ('London',), set()),
+    ('country by name', 'SELECT code FROM country WHERE name = ?',
+     ('Great Britain',), set()),
+    ('hosts of an event', '''SELECT host.host FROM host_event
+        JOIN host ON host_event.host_id = host.host_id WHERE host_event.event_id = ?''',
+     (1,), set()),
+    ('disability by category', 'SELECT disability_id FROM disability WHERE category = ?',
+     ('Spinal injury',), set()),
+    ('medal results of an event', '''SELECT country.name, medal_result.gold FROM medal_result
+        JOIN country ON medal_result.country_code = country.code WHERE medal_result.event_id = ?''',
+     (1,), set()),
+    ('medal results of a country', '''SELECT event.year, medal_result.total FROM medal_result
+        JOIN event ON medal_result.event_id = event.event_id WHERE medal_result.country_code = ?''',
+     ('GBR',), set()),
+    ('medal result by event and country', 'SELECT result_id FROM medal_result WHERE event_id = ? AND country_code = ?',
+     (1, 'GBR'), set()),
+    ('medal table', '''SELECT event.year, host.host, medal_result.country_code, medal_result.total FROM event
+        JOIN host_event ON event.event_id = host_event.event_id
+        JOIN host ON host_event.host_id = host.host_id
+        JOIN medal_result ON medal_result.event_id = event.event_id''',
+     (), {'event', 'host_event'}),
+]
+
+
+def table_exists(cursor, table):
+    """Return True if the table is in the database."""
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def create_indexes(cursor):
+    """Create any of the secondary indexes that do not already exist.
+
+    Indexes for tables that are not in the database are skipped, so this can be used with older versions of the
+    schema. The caller commits.
+
+    Parameters
+    ----------
+    cursor: sqlite cursor object
+
+    Returns
+    -------
+    created: list of the names of the indexes that were created
+    """
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for name, table, columns in INDEXES:
+        if name in existing or not table_exists(cursor, table):
+            continue
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+        created.append(name)
+    if created:
+        # Give the query planner statistics for the new indexes
+        cursor.execute('ANALYZE')
+    return created
+
+
+def full_scans(plan):
+    """Return the tables read in full in a query plan, i.e. 'SCAN table' without a WHERE clause on an index.
+
+    Parameters
+    ----------
+    plan: rows returned by EXPLAIN QUERY PLAN
+
+    Returns
+    -------
+    tables: set of table names
+    """
+    tables = set()
+    for row in plan:
+        detail = row[-1]
+        # e.g. 'SCAN event', 'SCAN TABLE event' in older SQLite versions, or 'SCAN event USING COVERING INDEX ...'
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if match:
+            tables.add(match.group(1))
+    return tables
+
+
+def check_query_plans(connection, queries=None):
+    """Run EXPLAIN QUERY PLAN for each query and flag the tables that are scanned but not expected to be.
+
+    Queries that use a table that is not in the database are skipped.
+
+    Parameters
+    ----------
+    connection: sqlite connection object
+    queries: list of (name, sql, parameters, expected scans), defaults to KNOWN_QUERIES
+
+    Returns
+    -------
+    results: list of dict with the name, plan (list of str), unexpected scans (set) and error (str or None)
+    """
+    results = []
+    for name, sql, params, expected_scans in queries or KNOWN_QUERIES:
+        try:
+            plan = connection.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except sqlite3.Error as e:
+            results.append({'name': name, 'plan': [], 'unexpected_scans': set(), 'error': str(e)})
+            continue
+        results.append({
+            'name': name,
+            'plan': [row[-1] for row in plan],
+            'unexpected_scans': full_scans(plan) - expected_scans,
+            'error': None,
+        })
+    return results
+
+
+def print_report(results):
+    """Print the query plans and return the number of queries with an unexpected full scan."""
+    flagged = 0
+    for result in results:
+        if result['error']:
+            print(f"SKIPPED {result['name']}: {result['error']}")
+            continue
+        if result['unexpected_scans']:
+            flagged += 1
+            print(f"FULL SCAN {result['name']}: {', '.join(sorted(result['unexpected_scans']))}")
+        else:
+            print(f"OK {result['name']}")
+        for detail in result['plan']:
+            print(f"    {detail}")
+    return flagged
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else resources.files("tutor.data").joinpath("paralympics.db")
+    # Open read only, the check never changes the database
+    conn = sqlite3.connect(read_only_uri(db_path, immutable=False), uri=True)
+    missing = [name for name, table, _ in INDEXES if table_exists(conn.cursor(), table) and not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()]
+    if missing:
+        print(f"Missing indexes: {', '.join(missing)}")
+    flagged_count = print_report(check_query_plans(conn))
+    conn.close()
+    sys.exit(1 if flagged_count else 0)
@@ -0,0 +1,103 @@
+"""
+Matching the rows of the medal_standings sheet to their event, and the repair of medal results matched to the wrong one.
+
+A row of the medal_standings sheet gives the year and host of the games, e.g. 1992 and 'Tignes-Albertville'. The year
+alone is not enough to find the event, as a summer and a winter games were held in some years. The sqlite3 loaders in
+student/placeholder/add_data_sql3.py use the first event of the year, so the winter results of those years are filed
+under the summer games and an event can have two results for the same country.
+
+Schema version 4 (see tutor.data.migrations) moves each of those results to the event of its year and host and then
+makes idx_medal_result_event_id unique, so an event has at most one result for each country.
+"""
+import sqlite3
+
+from tutor.data.indexes import table_exists
+
+MEDAL_RESULT_INDEX = 'idx_medal_result_event_id'
+
+unique_medal_result_index_sql = f'''CREATE UNIQUE INDEX {MEDAL_RESULT_INDEX}
+                                    ON medal_result (event_id, country_code)'''
+
+
+def location_key(year, location):
+    """Key used to match a medal result to an event, ignoring case and '-' as the spreadsheet spells some hosts
+    differently in the events and medal_standings sheets, e.g. 'Tignes Albertville' and 'Tignes-Albertville'."""
+    return int(year), location.lower().replace('-', ' ')
+
+
+def medal_event_ids(cursor):
+    """Return a dict of location_key(year, host) to event_id, used to find the event of a medal result."""
+    query = '''SELECT event.year, host.host, event.event_id FROM event
+               JOIN host_event ON event.event_id = host_event.event_id
+               JOIN host ON host_event.host_id = host.host_id'''
+    return {location_key(year, host): event_id for year, host, event_id in cursor.execute(query).fetchall()}
+
+
+def refile_medal_results(cursor, df):
+    """Move the medal results filed under the first event of their year to the event of their year and host.
+
+    A result is found by the event the loaders used, its country and its medal counts. Its result_id is kept, so the
+    rows that refer to it are unaffected. A result is not moved if its event already has a result for the country,
+    e.g. the database was loaded correctly.
+
+    Parameters
+    ----------
+    cursor: sqlite cursor object
+    df: pandas DataFrame of the medal_standings sheet
+
+    Returns
+    -------
+    moved: number of medal results moved to another event
+    """
+    event_ids = medal_event_ids(cursor)
+    first_event_ids = dict(cursor.execute('SELECT year, MIN(event_id) FROM event GROUP BY year').fetchall())
+    moved = 0
+    for row in df.itertuples(index=False):
+        event_id = event_ids.get(location_key(row.Year, row.Location))
+        filed_event_id = first_event_ids.get(int(row.Year))
+        if event_id is None or filed_event_id is None or event_id == filed_event_id:
+            continue
+        if cursor.execute('SELECT 1 FROM medal_result WHERE event_id = ? AND country_code = ?',
+                          (event_id, row.NPC)).fetchone():
+            continue
+        result = cursor.execute('''SELECT result_id FROM medal_result WHERE event_id = ? AND country_code = ?
+                                   AND gold = ? AND silver = ? AND bronze = ? AND total = ?''',
+                                (filed_event_id, row.NPC, row.Gold, row.Silver, row.Bronze, row.Total)).fetchone()
+        if result is None:
+            continue
+        cursor.execute('UPDATE medal_result SET event_id = ? WHERE result_id = ?', (event_id, result[0]))
+        moved += 1
+    return moved
+
+
+def make_medal_result_index_unique(cursor):
+    """Replace idx_medal_result_event_id with a unique index on the same columns.
+
+    Raises sqlite3.IntegrityError, naming some of the duplicates, if an event still has two results for a country.
+    """
+    duplicates = cursor.execute('''SELECT event_id, country_code FROM medal_result GROUP BY event_id, country_code
+                                   HAVING COUNT(*) > 1''').fetchall()
+    if duplicates:
+        raise sqlite3.IntegrityError(f'{len(duplicates)} events have more than one medal result for a country, '
+                                     f'(event_id, country_code): {duplicates[:5]}')
+    cursor.execute(f'DROP INDEX IF EXISTS {MEDAL_RESULT_INDEX}')
+    cursor.execute(unique_medal_result_index_sql)
+
+
+def repair_medal_results(cursor, df):
+    """Refile the medal results of a database loaded by the sqlite3 loaders and make the results of an event unique.
+
+    Parameters
+    ----------
+    cursor: sqlite cursor object
+    df: pandas DataFrame of the medal_standings sheet
+
+    Returns
+    -------
+    moved: number of medal results moved to another event
+    """
+    if not table_exists(cursor, 'medal_result'):
+        return 0
+    moved = refile_medal_results(cursor, df)
+    make_medal_result_index_unique(cursor)
+    return moved
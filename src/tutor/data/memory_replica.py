@@ -0,0 +1,112 @@
+"""
+In-memory copy of the paralympics database for apps that only read it.
+
+The database file is copied into a shared-cache in-memory database with the sqlite3 backup API, so queries never read
+from disk. Every connection from connect() uses the same in-memory copy, which exists for as long as the replica keeps
+its own connection to it open.
+
+When the database file changes, the next connect() copies it again into a new in-memory database. Connections to the
+previous copy keep working until they are closed, use is_current() to find out if a connection should be replaced.
+"""
+import itertools
+import sqlite3
+import threading
+
+from tutor.data.file_version import file_version
+from tutor.data.read_only import read_only_uri
+
+# Makes the name of each in-memory database unique within the process
+_replica_ids = itertools.count(1)
+
+
+class ReplicaConnection(sqlite3.Connection):
+    """ sqlite3 connection that records which copy of the database it is connected to. """
+    generation = None
+
+
+class MemoryReplica:
+    """ Thread-safe in-memory copy of a SQLite database file.
+
+    Attributes:
+        path (str): Path to the database file that is copied.
+        generation (int): Number of the current copy, 0 until the file is first copied.
+        version (tuple): file_version() of the file when it was last copied, None until then.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.generation = 0
+        self.version = None
+        self._name = f'replica_{next(_replica_ids)}'
+        self._anchor = None
+        self._lock = threading.Lock()
+
+    def _uri(self, generation):
+        """ Return the URI of a copy of the database. """
+        return f'file:{self._name}_{generation}?mode=memory&cache=shared'
+
+    def sync(self):
+        """ Copy the database file into a new in-memory database and make it the current copy. """
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        """ Copy the database file. Must be called holding the lock. """
+        version = file_version(self.path)
+        generation = self.generation + 1
+        # The in-memory database is deleted when its last connection closes, so the replica keeps one open
+        anchor = sqlite3.connect(self._uri(generation), uri=True, check_same_thread=False)
+        source = sqlite3.connect(read_only_uri(self.path, immutable=False), uri=True)
+        try:
+            source.backup(anchor)
+        except sqlite3.Error:
+            anchor.close()
+            raise
+        finally:
+            source.close()
+
+        previous, self._anchor = self._anchor, anchor
+        self.generation = generation
+        self.version = version
+        if previous is not None:
+            previous.close()
+
+    def ensure_current(self):
+        """ Copy the database file if it has not been copied yet or has changed since it was last copied. """
+        if self.version != file_version(self.path):
+            with self._lock:
+                # Another thread may have copied the file while this one was waiting for the lock
+                if self.version != file_version(self.path):
+                    self._sync()
+
+    def connect(self, **kwargs):
+        """ Open a connection to the current in-memory copy, copying the file first if it has changed.
+
+        Parameters
+        kwargs: other arguments to sqlite3.connect(), e.g. detect_types or check_same_thread. A factory other than
+                ReplicaConnection must allow the generation attribute to be set.
+
+        Returns
+        conn: ReplicaConnection, or an instance of the factory
+        """
+        self.ensure_current()
+        kwargs.setdefault('factory', ReplicaConnection)
+        with self._lock:
+            conn = sqlite3.connect(self._uri(self.generation), uri=True, **kwargs)
+            conn.generation = self.generation
+        # Changes would only be made to the copy, so refuse them
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def is_current(self, conn):
+        """ Return True if the connection is to the copy of the current version of the database file. """
+        self.ensure_current()
+        return getattr(conn, 'generation', None) == self.generation
+
+    def close(self):
+        """ Close the replica's own connection, the copy is freed once every other connection to it is closed. """
+        with self._lock:
+            if self._anchor is not None:
+                self._anchor.close()
+                self._anchor = None
+            self.version = None
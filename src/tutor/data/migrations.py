@@ -0,0 +1,214 @@
+"""
+Versioned migrations of the paralympics database schema.
+
+The schema version is stored in the database with PRAGMA user_version. A database that has never been migrated has
+user_version 0 and is treated as version 1, the schema created by create_db() or the paralympics.db in this package.
+
+Version 2 rebuilds every table as a STRICT table:
+- event.type is TEXT, it holds 'summer' or 'winter' but was declared INTEGER
+- event.start and event.end are ISO 8601 dates, YYYY-MM-DD, so they sort and compare as dates and can use an index
+- host.latitude and host.longitude are REAL rather than TEXT
+- host_event.host_id is INTEGER to match host.host_id, so the join compares integers
+
+Version 3 adds the event_summary table and the triggers that keep it in sync, see tutor.data.event_summary.
+
+Version 4 moves the medal results that the sqlite3 loaders filed under the wrong event to the event of their year and
+host, using the medal_standings sheet of paralympics.xlsx, and makes idx_medal_result_event_id a unique index so an
+event has at most one result for each country, see tutor.data.medal_results.
+
+STRICT tables only convert a value to the declared type when no information is lost, e.g. '41.8931' to 41.8931. Any
+other value raises an error and the whole migration is rolled back, so the data is never changed partially.
+
+Run this module to migrate a database to the latest version:
+
+    python -m tutor.data.migrations [path/to/paralympics.db]
+"""
+import sqlite3
+import sys
+from importlib import resources
+
+from tutor.data.event_summary import create_event_summary
+from tutor.data.medal_results import repair_medal_results
+from tutor.data.snapshot import read_sheet
+
+# Columns whose declared type is changed by version 2, (table, column): type
+V2_COLUMN_TYPES = {
+    ('event', 'type'): 'TEXT',
+    ('host', 'latitude'): 'REAL',
+    ('host', 'longitude'): 'REAL',
+    ('host_event', 'host_id'): 'INTEGER',
+}
+
+# Converts a 'dd/mm/YYYY' date to 'YYYY-MM-DD', other values are copied unchanged
+ISO_DATE_SQL = '''CASE WHEN {column} LIKE '__/__/____'
+                  THEN substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)
+                  ELSE {column} END'''
+
+# Expressions used to copy a column into the version 2 table, (table, column): SQL
+V2_COLUMN_VALUES = {
+    ('event', 'start'): ISO_DATE_SQL.format(column='"start"'),
+    ('event', 'end'): ISO_DATE_SQL.format(column='"end"'),
+}
+
+STRICT_TYPES = {'INT', 'INTEGER', 'REAL', 'TEXT', 'BLOB', 'ANY'}
+
+
+def schema_version(cursor):
+    """Return the schema version of the database, 1 if it has never been migrated."""
+    return max(cursor.execute('PRAGMA user_version').fetchone()[0], 1)
+
+
+def event_date_format(cursor):
+    """Return the strftime format used for event.start and event.end in the database."""
+    return '%Y-%m-%d' if schema_version(cursor) >= 2 else '%d/%m/%Y'
+
+
+def user_tables(cursor):
+    """Return the names of the tables in the database, excluding SQLite's internal tables."""
+    return [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid")]
+
+
+def strict_table_sql(cursor, table, new_name):
+    """Return the CREATE TABLE statement for a STRICT copy of a table with the version 2 column types.
+
+    The columns, NOT NULL constraints, defaults, primary key and foreign keys are taken from the existing table.
+    """
+    columns = cursor.execute('SELECT name, type, "notnull", dflt_value, pk FROM pragma_table_info(?)',
+                             (table,)).fetchall()
+    pk_columns = [name for name, _, _, _, pk in sorted(columns, key=lambda c: c[4]) if pk]
+
+    definitions = []
+    for name, declared_type, not_null, default, pk in columns:
+        column_type = V2_COLUMN_TYPES.get((table, name), declared_type.upper())
+        if column_type not in STRICT_TYPES:
+            column_type = 'ANY'
+        definition = f'"{name}" {column_type}'
+        if len(pk_columns) == 1 and pk:
+            definition += ' PRIMARY KEY'
+        if not_null:
+            definition += ' NOT NULL'
+        if default is not None:
+            definition += f' DEFAULT {default}'
+        definitions.append(definition)
+    if len(pk_columns) > 1:
+        definitions.append(f"PRIMARY KEY ({', '.join(pk_columns)})")
+
+    foreign_keys = {}
+    for fk_id, _, parent, from_column, to_column, on_update, on_delete, _ in cursor.execute(
+            'SELECT * FROM pragma_foreign_key_list(?) ORDER BY id, seq', (table,)):
+        fk = foreign_keys.setdefault(fk_id, {'parent': parent, 'from': [], 'to': [],
+                                             'actions': f'ON DELETE {on_delete} ON UPDATE {on_update}'})
+        fk['from'].append(from_column)
+        fk['to'].append(to_column)
+    for fk in foreign_keys.values():
+        definitions.append(f"FOREIGN KEY ({', '.join(fk['from'])}) REFERENCES {fk['parent']}({', '.join(fk['to'])}) "
+                           f"{fk['actions']}")
+
+    return f'CREATE TABLE {new_name} (\n    ' + ',\n    '.join(definitions) + '\n) STRICT'
+
+
+def migrate_v2(cursor):
+    """Rebuild each table as a STRICT table with typed keys, ISO dates and REAL coordinates.
+
+    Follows the steps for changing a table's schema in the SQLite documentation: create the new table, copy the rows,
+    drop the old table, rename the new one and then recreate the indexes and triggers.
+    """
+    # Indexes and triggers are dropped with their table, keep their SQL to recreate them
+    schema_sql = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL")]
+
+    for table in user_tables(cursor):
+        new_table = f'{table}_v2'
+        row_count = cursor.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        columns = [row[0] for row in cursor.execute('SELECT name FROM pragma_table_info(?)', (table,))]
+        values = [V2_COLUMN_VALUES.get((table, column), f'"{column}"') for column in columns]
+
+        cursor.execute(strict_table_sql(cursor, table, new_table))
+        cursor.execute(f'''INSERT INTO {new_table} ({', '.join(f'"{c}"' for c in columns)})
+                           SELECT {', '.join(values)} FROM "{table}"''')
+        if cursor.execute(f'SELECT COUNT(*) FROM {new_table}').fetchone()[0] != row_count:
+            raise sqlite3.IntegrityError(f'Rows were lost copying the {table} table')
+        cursor.execute(f'DROP TABLE "{table}"')
+        cursor.execute(f'ALTER TABLE {new_table} RENAME TO "{table}"')
+
+    for sql in schema_sql:
+        cursor.execute(sql)
+
+
+def migrate_v3(cursor):
+    """Add the event_summary table and its triggers."""
+    create_event_summary(cursor)
+
+
+def migrate_v4(cursor):
+    """Move the medal results filed under the wrong event and make the results of an event unique for each country."""
+    data_path = resources.files("tutor.data").joinpath("paralympics.xlsx")
+    moved = repair_medal_results(cursor, read_sheet(data_path, 'medal_standings'))
+    if moved:
+        print(f'Moved {moved} medal results to the event of their year and host')
+
+
+# Version number and the function that migrates the database from the previous version
+MIGRATIONS = [
+    (2, migrate_v2),
+    (3, migrate_v3),
+    (4, migrate_v4),
+]
+
+
+def migrate(connection, target=None):
+    """Migrate a database to a version of the schema, by default the latest.
+
+    Each migration runs in its own transaction and the database is left at the last version that completed.
+
+    Parameters
+    ----------
+    connection: sqlite connection object
+    target: version to migrate to, defaults to the latest version
+
+    Returns
+    -------
+    version: schema version of the database after the migration
+    """
+    cursor = connection.cursor()
+    if target is None:
+        target = MIGRATIONS[-1][0]
+    version = schema_version(cursor)
+    # PRAGMA foreign_keys has no effect inside a transaction
+    if connection.in_transaction:
+        connection.commit()
+
+    # Foreign keys must be off while a table is rebuilt, they are checked before each migration is committed
+    foreign_keys = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+    cursor.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for migration_version, migration in MIGRATIONS:
+            if migration_version <= version or migration_version > target:
+                continue
+            try:
+                cursor.execute('BEGIN')
+                migration(cursor)
+                problems = cursor.execute('PRAGMA foreign_key_check').fetchall()
+                if problems:
+                    raise sqlite3.IntegrityError(f'Foreign key check failed: {problems[:5]}')
+                cursor.execute(f'PRAGMA user_version = {migration_version}')
+                connection.commit()
+                version = migration_version
+                print(f'Migrated the database to version {version}')
+            except sqlite3.Error as e:
+                print(f'An error occurred migrating the database to version {migration_version}. Error: {e}')
+                connection.rollback()
+                break
+    finally:
+        cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+    return version
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else resources.files("tutor.data").joinpath("paralympics.db")
+    # Autocommit mode, the transactions are started and committed by migrate()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    print(f'Database {db_path} is at version {schema_version(conn.cursor())}')
+    migrate(conn)
+    conn.close()
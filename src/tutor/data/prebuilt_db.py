@@ -0,0 +1,127 @@
+"""
+Prebuilt database made from an SQL dump, e.g. paralympics.sql, for fast provisioning.
+
+Running the dump with executescript parses and executes every statement each time a database is created. Instead, the
+dump is run once into a database file next to it, e.g. paralympics.prebuilt.db, and a manifest,
+paralympics.prebuilt.json, records the SHA-256 hashes, sizes and modification times of the dump and of the database
+file. A new database is then a copy of the prebuilt file made with the sqlite3 backup API. The files are only hashed
+when their size or modification time no longer match the manifest.
+
+The prebuilt database is made again when the dump changes, or if its own hash no longer matches the manifest. If it
+cannot be written, e.g. the directory is read only, the dump is run with executescript as before.
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from tutor.data.read_only import read_only_uri
+from tutor.data.snapshot import file_hash
+
+
+def prebuilt_path(sql_path):
+    """Return the path of the prebuilt database for an SQL dump."""
+    sql_path = Path(sql_path)
+    return sql_path.with_name(f"{sql_path.stem}.prebuilt.db")
+
+
+def manifest_path(sql_path):
+    """Return the path of the manifest of the prebuilt database for an SQL dump."""
+    sql_path = Path(sql_path)
+    return sql_path.with_name(f"{sql_path.stem}.prebuilt.json")
+
+
+def read_manifest(sql_path):
+    """Return the manifest if the prebuilt database was made from the current dump and is unchanged, otherwise None."""
+    try:
+        manifest = json.loads(manifest_path(sql_path).read_text())
+    except (OSError, ValueError):
+        return None
+    try:
+        changed = False
+        for prefix, path in (('sql', sql_path), ('db', prebuilt_path(sql_path))):
+            stat = os.stat(path)
+            if (manifest.get(f'{prefix}_size'), manifest.get(f'{prefix}_mtime_ns')) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            # The file has been touched, only hash it when this cheap check fails
+            if manifest.get(f'{prefix}_sha256') != file_hash(path):
+                return None
+            manifest.update({f'{prefix}_size': stat.st_size, f'{prefix}_mtime_ns': stat.st_mtime_ns})
+            changed = True
+    except OSError:
+        return None
+    if changed:
+        # The contents are the same, save the new sizes and times so the files are not hashed again on the next call
+        try:
+            write_manifest(sql_path, manifest)
+        except OSError:
+            pass
+    return manifest
+
+
+def write_manifest(sql_path, manifest):
+    """Write the manifest of the prebuilt database for an SQL dump."""
+    tmp_path = manifest_path(sql_path).with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, manifest_path(sql_path))
+
+
+def build_prebuilt_db(sql_path):
+    """Run the SQL dump into a new prebuilt database file and write its manifest.
+
+    Parameters
+    ----------
+    sql_path: path to the .sql file
+
+    Returns
+    -------
+    manifest: dict with the hashes of the dump and the prebuilt database
+    """
+    stat = os.stat(sql_path)
+    sql_sha256 = file_hash(sql_path)
+    db_path = prebuilt_path(sql_path)
+    tmp_path = db_path.with_name(db_path.name + '.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(Path(sql_path).read_text(encoding='utf8'))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+
+    # The manifest is written last, so the prebuilt database is only used once it is complete
+    db_stat = os.stat(db_path)
+    manifest = {'sql_sha256': sql_sha256, 'sql_size': stat.st_size, 'sql_mtime_ns': stat.st_mtime_ns,
+                'db_sha256': file_hash(db_path), 'db_size': db_stat.st_size, 'db_mtime_ns': db_stat.st_mtime_ns}
+    write_manifest(sql_path, manifest)
+    print(f'Built {db_path} from {sql_path}')
+    return manifest
+
+
+def provision_db(connection, sql_path):
+    """Replace the contents of a database with the data in an SQL dump, using the prebuilt database when it is current.
+
+    Parameters
+    ----------
+    connection: sqlite connection object for the database to provision
+    sql_path: path to the .sql file
+    """
+    if read_manifest(sql_path) is None:
+        try:
+            build_prebuilt_db(sql_path)
+        except (OSError, sqlite3.Error) as e:
+            print(f'Could not build the prebuilt database for {sql_path}, running the SQL instead. Error: {e}')
+            connection.executescript(Path(sql_path).read_text(encoding='utf8'))
+            return
+
+    if connection.in_transaction:
+        connection.commit()
+    # Open read only so the prebuilt database can never be changed by mistake
+    source = sqlite3.connect(read_only_uri(prebuilt_path(sql_path), immutable=False), uri=True)
+    try:
+        source.backup(connection)
+    finally:
+        source.close()
@@ -0,0 +1,63 @@
+"""
+Read-only connections to the paralympics database for apps that only ever read it.
+
+The database is opened with a file: URI in mode=ro. SQLite still notices when another process changes the file, so the
+caches that are rebuilt when the database changes, e.g. the EventIndex and the ETags of the Flask app, see the new data.
+
+immutable=True also tells SQLite that nothing else changes the file, so it takes no locks and does not check the
+journal or the file for changes before each query. It is off by default: a long-lived connection, such as one kept in
+a pool, would go on reading the old pages after the file changed. Only turn it on when the database is never written to
+while the app is running and nothing relies on seeing changes to it.
+
+Memory-mapped I/O reads pages directly from the operating system's page cache, which is shared by every process that
+has the file open, and a larger page cache keeps the pages a connection has already read in memory.
+"""
+import sqlite3
+from pathlib import Path
+
+# Bytes of the database file to memory map, larger than paralympics.db so all of it is mapped
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Negative values are in KiB, i.e. 64 MB for each connection
+CACHE_SIZE = -64000
+
+
+def read_only_uri(path, immutable=False):
+    """Return the file: URI that opens a database read only.
+
+    Parameters
+    ----------
+    path: path to the database file
+    immutable: True to also tell SQLite the file cannot change while it is open
+
+    Returns
+    -------
+    uri: str
+    """
+    uri = f'{Path(path).resolve().as_uri()}?mode=ro'
+    if immutable:
+        uri += '&immutable=1'
+    return uri
+
+
+def connect_read_only(path, immutable=False, mmap_size=MMAP_SIZE, cache_size=CACHE_SIZE, **kwargs):
+    """Open a read-only connection to a database with memory-mapped I/O and a larger page cache.
+
+    Parameters
+    ----------
+    path: path to the database file
+    immutable: True to skip locking and change detection, see the module docstring
+    mmap_size: bytes of the file to memory map, 0 to turn memory mapping off
+    cache_size: page cache size, in pages if positive or KiB if negative
+    kwargs: other arguments to sqlite3.connect(), e.g. detect_types or check_same_thread
+
+    Returns
+    -------
+    conn: sqlite3.Connection, any write raises sqlite3.OperationalError
+    """
+    conn = sqlite3.connect(read_only_uri(path, immutable), uri=True, **kwargs)
+    conn.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
+    conn.execute(f'PRAGMA cache_size = {int(cache_size)}')
+    # Keep the temporary tables and indexes used to sort query results in memory rather than in temporary files
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
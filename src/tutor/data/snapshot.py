@@ -0,0 +1,157 @@
+"""
+Columnar snapshot of the sheets in an Excel workbook, e.g. paralympics.xlsx.
+
+Reading .xlsx with openpyxl is slow. The first read converts every sheet to a typed Parquet file next to the workbook,
+e.g. paralympics.events.parquet, and writes a manifest, paralympics.snapshot.json, with a SHA-256 hash of the
+workbook. Later reads use the Parquet files for as long as the hash still matches the workbook.
+
+Parquet needs the pyarrow package: `pip install pyarrow`. Without it, or if the snapshot cannot be written, the sheets
+are read from the workbook as before.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # used by pandas to read and write Parquet
+    HAS_PYARROW = True
+    # Errors writing the snapshot, e.g. ArrowTypeError for an Excel column with numbers and text in it
+    SNAPSHOT_ERRORS = (OSError, pyarrow.ArrowException)
+except ImportError:
+    HAS_PYARROW = False
+    SNAPSHOT_ERRORS = (OSError,)
+
+
+def manifest_path(data_path):
+    """Return the path of the snapshot manifest for a workbook."""
+    data_path = Path(data_path)
+    return data_path.with_name(f"{data_path.stem}.snapshot.json")
+
+
+def sheet_path(data_path, sheet_name):
+    """Return the path of the Parquet file for a sheet of a workbook."""
+    data_path = Path(data_path)
+    return data_path.with_name(f"{data_path.stem}.{sheet_name}.parquet")
+
+
+def file_hash(path):
+    """Return the SHA-256 hash of a file as a hex string."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def read_manifest(data_path):
+    """Return the manifest if the snapshot matches the current workbook, otherwise None."""
+    try:
+        manifest = json.loads(manifest_path(data_path).read_text())
+    except (OSError, ValueError):
+        return None
+    if not all(sheet_path(data_path, sheet).exists() for sheet in manifest.get('sheets', [])):
+        return None
+    stat = os.stat(data_path)
+    if (manifest.get('size'), manifest.get('mtime_ns')) != (stat.st_size, stat.st_mtime_ns):
+        # The file has been touched, only hash it when this cheap check fails
+        if manifest.get('sha256') != file_hash(data_path):
+            return None
+        # The contents are the same, save the new size and time so the file is not hashed again on the next read
+        manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        try:
+            write_manifest(data_path, manifest)
+        except OSError:
+            pass
+    return manifest
+
+
+def write_manifest(data_path, manifest):
+    """Write the snapshot manifest of a workbook."""
+    tmp_path = manifest_path(data_path).with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, manifest_path(data_path))
+
+
+def write_snapshot(data_path):
+    """Convert every sheet of the workbook to Parquet and write the manifest.
+
+    If the snapshot cannot be written, e.g. the directory is read only or a column cannot be converted to Parquet, a
+    warning is printed and no manifest is written, so the workbook is read again next time.
+
+    Parameters
+    ----------
+    data_path: path to the .xlsx file
+
+    Returns
+    -------
+    sheets: dict of sheet name and DataFrame, as read from the workbook
+    """
+    stat = os.stat(data_path)
+    sha256 = file_hash(data_path)
+    # Parse the workbook once for all the sheets
+    sheets = pd.read_excel(data_path, sheet_name=None)
+    tmp_path = None
+    try:
+        for sheet_name, df in sheets.items():
+            path = sheet_path(data_path, sheet_name)
+            tmp_path = path.with_name(path.name + '.tmp')
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+        # The manifest is written last, so a snapshot is only used once all the sheets have been written
+        write_manifest(data_path, {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                   'sheets': list(sheets)})
+    except SNAPSHOT_ERRORS as e:
+        print(f'Could not write the snapshot of {data_path}, the workbook will be read again next time. Error: {e}')
+        if tmp_path is not None and tmp_path.exists():
+            tmp_path.unlink()
+    return sheets
+
+
+def read_sheet(data_path, sheet_name, usecols=None):
+    """Read a sheet of a workbook, using the snapshot when it is up to date.
+
+    Use in place of pd.read_excel(data_path, sheet_name=sheet_name, usecols=usecols).
+
+    Parameters
+    ----------
+    data_path: path to the .xlsx file
+    sheet_name: name of the sheet
+    usecols: optional list of column names
+
+    Returns
+    -------
+    df: pandas DataFrame
+    """
+    if not HAS_PYARROW:
+        return pd.read_excel(data_path, sheet_name=sheet_name, usecols=usecols)
+
+    if read_manifest(data_path) is not None:
+        return pd.read_parquet(sheet_path(data_path, sheet_name), columns=usecols)
+
+    df = write_snapshot(data_path)[sheet_name]
+    return df if usecols is None else df[usecols]
+
+
+def read_workbook_sheets(data_path, sheet_names):
+    """Read several sheets of a workbook, parsing the workbook at most once.
+
+    Use in place of calling read_sheet() for each sheet, which parses the whole workbook for every sheet when pyarrow is
+    not installed.
+
+    Parameters
+    ----------
+    data_path: path to the .xlsx file
+    sheet_names: list of sheet names
+
+    Returns
+    -------
+    sheets: dict of sheet name and pandas DataFrame
+    """
+    if not HAS_PYARROW:
+        return pd.read_excel(data_path, sheet_name=list(sheet_names))
+
+    if read_manifest(data_path) is not None:
+        return {sheet_name: pd.read_parquet(sheet_path(data_path, sheet_name)) for sheet_name in sheet_names}
+
+    sheets = write_snapshot(data_path)
+    return {sheet_name: sheets[sheet_name] for sheet_name in sheet_names}
@@ -0,0 +1,295 @@
+"""
+Contains functions to update an existing paralympics database from the spreadsheet without dropping any tables.
+
+Each row of the 'npc_codes', 'events' and 'medal_standings' sheets is fingerprinted and the fingerprints are saved in
+the database. On the next update only rows that are new, or whose fingerprint has changed, are written. The quiz and
+student_response data is never touched.
+
+A medal result is matched to its event by the year and host, see tutor.data.medal_results. The result_id of the row
+written for each row of the medal_standings sheet is saved with its fingerprint, so a changed row updates that result
+and no other. Nothing is deleted, rows removed from the spreadsheet stay in the database.
+"""
+import sqlite3
+from importlib import resources
+
+import pandas as pd
+
+from tutor.data.indexes import create_indexes
+from tutor.data.medal_results import location_key, medal_event_ids
+from tutor.data.migrations import event_date_format
+from tutor.data.snapshot import read_workbook_sheets
+
+fingerprint_sql = '''CREATE TABLE IF NOT EXISTS source_fingerprint (
+                        sheet TEXT NOT NULL,
+                        row_key TEXT NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        row_id INTEGER,
+                        PRIMARY KEY (sheet, row_key)
+                    )'''
+
+# Returned by an upsert function for a row it did not write. Its fingerprint is not saved, so the row is tried again by
+# the next update.
+NOT_WRITTEN = -1
+
+
+def create_fingerprint_table(cursor):
+    """Create the source_fingerprint table, adding the row_id column if the table was created without it."""
+    cursor.execute(fingerprint_sql)
+    columns = [row[0] for row in cursor.execute("SELECT name FROM pragma_table_info('source_fingerprint')")]
+    if 'row_id' not in columns:
+        cursor.execute('ALTER TABLE source_fingerprint ADD COLUMN row_id INTEGER')
+
+
+def saved_row_ids(cursor, sheet, keys):
+    """Return the row_id saved with the fingerprint of each key, None for a row that has no row_id yet."""
+    row_ids = dict(cursor.execute('SELECT row_key, row_id FROM source_fingerprint WHERE sheet = ?', (sheet,)))
+    return [row_ids.get(key) for key in keys]
+
+
+def changed_rows(cursor, sheet, df, keys):
+    """Find the rows of a sheet that are new or have changed since the last update.
+
+    Parameters
+    ----------
+    cursor: sqlite cursor object
+    sheet: name of the sheet
+    df: pandas DataFrame of the sheet
+    keys: pandas Series of the natural key for each row of df, as strings
+
+    Returns
+    -------
+    df_changed: the new or changed rows of df
+    fingerprints: list of (sheet, row_key, fingerprint) to save once the rows have been written
+    """
+    # hash_pandas_object uses a fixed hash key, so the same row values always give the same fingerprint
+    fingerprints = pd.util.hash_pandas_object(df, index=False).map('{:016x}'.format)
+    previous = dict(cursor.execute('SELECT row_key, fingerprint FROM source_fingerprint WHERE sheet = ?', (sheet,)))
+    is_changed = [previous.get(key) != fingerprint for key, fingerprint in zip(keys, fingerprints)]
+    changed = [(sheet, key, fingerprint) for key, fingerprint, c in zip(keys, fingerprints, is_changed) if c]
+    return df[is_changed], changed
+
+
+def upsert_country_data(df, cursor, row_ids):
+    """Insert new countries and update changed ones. A country is identified by its code, so no row_id is saved."""
+    sql = '''INSERT INTO country (code, name, region, sub_region, member_type, notes) VALUES (?, ?, ?, ?, ?, ?)
+             ON CONFLICT (code) DO UPDATE SET name = excluded.name, region = excluded.region,
+             sub_region = excluded.sub_region, member_type = excluded.member_type, notes = excluded.notes'''
+    cursor.executemany(sql, df.itertuples(index=False, name=None))
+    return [None] * len(df)
+
+
+def upsert_event_data(df, cursor, row_ids):
+    """Insert new events and update changed ones, including their participants, hosts and disabilities.
+
+    An existing event keeps its event_id, so the medal results and questions that refer to it are unaffected.
+
+    Returns
+    -------
+    event_ids: the event_id of each row of df
+    """
+    # Dates are ISO 8601 from schema version 2, see tutor.data.migrations
+    date_format = event_date_format(cursor)
+    event_ids = []
+    for row in df.itertuples(index=False):
+        values = (row.type, row.year, row.start.strftime(date_format), row.end.strftime(date_format), row.countries,
+                  row.events, row.sports, row.highlights, row.url)
+        participant_values = (row.participants_m, row.participants_f, row.participants)
+        result = cursor.execute('SELECT event_id FROM event WHERE year = ? AND type = ?',
+                                (row.year, row.type)).fetchone()
+        if result is None:
+            cursor.execute('''INSERT INTO event (type, year, start, end, countries, events, sports, highlights, url)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', values)
+            event_id = cursor.lastrowid
+        else:
+            event_id = result[0]
+            cursor.execute('''UPDATE event SET type = ?, year = ?, start = ?, end = ?, countries = ?, events = ?,
+                              sports = ?, highlights = ?, url = ? WHERE event_id = ?''', values + (event_id,))
+
+        cursor.execute('''UPDATE participants SET participants_m = ?, participants_f = ?, participants = ?
+                          WHERE event_id = ?''', participant_values + (event_id,))
+        if cursor.rowcount == 0:
+            cursor.execute('''INSERT INTO participants (participants_m, participants_f, participants, event_id)
+                              VALUES (?, ?, ?, ?)''', participant_values + (event_id,))
+
+        # Replace the hosts of the event, adding any host that is not already in the host table
+        cursor.execute('DELETE FROM host_event WHERE event_id = ?', (event_id,))
+        for host, country in zip(row.host.split(','), row.country.split(',')):
+            result = cursor.execute('SELECT host_id FROM host WHERE host = ?', (host.strip(),)).fetchone()
+            if result is None:
+                code = cursor.execute('SELECT code FROM country WHERE name = ?', (country.strip(),)).fetchone()
+                if code is None:
+                    continue
+                cursor.execute('INSERT INTO host (country_code, host) VALUES (?, ?)', (code[0], host.strip()))
+                host_id = cursor.lastrowid
+            else:
+                host_id = result[0]
+            cursor.execute('INSERT INTO host_event (host_id, event_id) VALUES (?, ?)', (host_id, event_id))
+
+        # Replace the disabilities of the event, adding any disability category that is new
+        cursor.execute('DELETE FROM disability_event WHERE event_id = ?', (event_id,))
+        for category in row.disabilities.split(', '):
+            result = cursor.execute('SELECT disability_id FROM disability WHERE category = ?', (category,)).fetchone()
+            if result is None:
+                cursor.execute('INSERT INTO disability (category) VALUES (?)', (category,))
+                disability_id = cursor.lastrowid
+            else:
+                disability_id = result[0]
+            cursor.execute('INSERT INTO disability_event (event_id, disability_id) VALUES (?, ?)',
+                           (event_id, disability_id))
+        event_ids.append(event_id)
+    return event_ids
+
+
+def upsert_medal_result_data(df, cursor, row_ids):
+    """Insert new medal results and update changed ones.
+
+    A row that was written by an earlier update updates the result with its saved result_id. Otherwise the result is
+    matched to an event using the year and host, and updates the existing result for the same event and country if
+    there is one.
+
+    A database loaded by the sqlite3 loaders can have two results for the same event and country until it is migrated
+    to schema version 4, see tutor.data.medal_results. Such a row is not written, as the result it should update cannot
+    be told apart, and is tried again by the next update.
+
+    Parameters
+    ----------
+    df: pandas DataFrame of the new and changed rows of the medal_standings sheet
+    cursor: sqlite cursor object
+    row_ids: the saved result_id of each row of df, or None
+
+    Returns
+    -------
+    result_ids: the result_id of each row of df, NOT_WRITTEN for a row that was not written
+    """
+    event_ids = medal_event_ids(cursor)
+    result_ids = []
+    for row, result_id in zip(df.itertuples(index=False), row_ids):
+        event_id = event_ids.get(location_key(row.Year, row.Location))
+        if event_id is None:
+            print(f'No event found for the {row.Location} {row.Year} medal result for {row.NPC}, it was not added.')
+            result_ids.append(NOT_WRITTEN)
+            continue
+        values = (event_id, row.NPC, row.Rank, row.Gold, row.Silver, row.Bronze, row.Total)
+        if result_id is None:
+            results = cursor.execute('SELECT result_id FROM medal_result WHERE event_id = ? AND country_code = ?',
+                                     (event_id, row.NPC)).fetchall()
+            if len(results) > 1:
+                print(f'The {row.Location} {row.Year} event has {len(results)} medal results for {row.NPC}, it was not '
+                      f'updated. Run python -m tutor.data.migrations to file the results under the right event.')
+                result_ids.append(NOT_WRITTEN)
+                continue
+            result_id = results[0][0] if results else None
+        if result_id is not None:
+            cursor.execute('''UPDATE medal_result SET event_id = ?, country_code = ?, rank = ?, gold = ?, silver = ?,
+                              bronze = ?, total = ? WHERE result_id = ?''', values + (result_id,))
+            if cursor.rowcount == 0:
+                # The result has been deleted since it was saved
+                result_id = None
+        if result_id is None:
+            cursor.execute('''INSERT INTO medal_result (event_id, country_code, rank, gold, silver, bronze, total)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''', values)
+            result_id = cursor.lastrowid
+        result_ids.append(result_id)
+    return result_ids
+
+
+def read_sheets(data_path=None, sheets=None):
+    """Read the sheets used by the database.
+
+    Parameters
+    ----------
+    data_path: path to the spreadsheet, defaults to paralympics.xlsx in this package
+    sheets: dict of sheet name and DataFrame already read from the spreadsheet, e.g. returned by add_all_data(). The
+            spreadsheet is only read if this is None.
+
+    Returns
+    -------
+    sheets: list of (sheet name, DataFrame, natural key of each row, function that writes the rows and returns the
+            row_id of each). Countries and events are first as the later sheets refer to them.
+    """
+    if sheets is None:
+        if data_path is None:
+            data_path = resources.files("tutor.data").joinpath("paralympics.xlsx")
+        sheets = read_workbook_sheets(data_path, ['npc_codes', 'events', 'medal_standings'])
+    npc_df = sheets['npc_codes']
+    events_df = sheets['events']
+    medals_df = sheets['medal_standings']
+
+    return [
+        ('npc_codes', npc_df, npc_df['code'], upsert_country_data),
+        ('events', events_df, events_df['type'] + ' ' + events_df['year'].astype(str), upsert_event_data),
+        ('medal_standings', medals_df,
+         medals_df['Year'].astype(str) + ' ' + medals_df['Location'] + ' ' + medals_df['NPC'],
+         upsert_medal_result_data),
+    ]
+
+
+def save_fingerprints(cursor, connection, data_path=None, sheets=None):
+    """Record the fingerprint of every row of the spreadsheet without changing any data.
+
+    Called by create_db() after a full rebuild, so that the next update_db() only writes rows that change after that.
+    No row_id is saved, a medal result is found by its event and country the first time update_db() changes it.
+
+    Parameters
+    ----------
+    connection: sqlite connection object
+    cursor: sqlite cursor object
+    data_path: path to the spreadsheet, defaults to paralympics.xlsx in this package
+    sheets: dict of sheet name and DataFrame as loaded into the database, so the spreadsheet is not read again
+    """
+    try:
+        create_fingerprint_table(cursor)
+        cursor.execute('DELETE FROM source_fingerprint')
+        for sheet, df, keys, _ in read_sheets(data_path, sheets):
+            _, fingerprints = changed_rows(cursor, sheet, df, keys)
+            cursor.executemany('INSERT INTO source_fingerprint (sheet, row_key, fingerprint) VALUES (?, ?, ?)',
+                               fingerprints)
+        connection.commit()
+
+    except sqlite3.Error as e:
+        print(f'An error occurred saving the spreadsheet fingerprints. Error: {e}')
+        if connection:
+            connection.rollback()
+
+
+def update_db(cursor, connection, data_path=None):
+    """Add new and changed rows from the spreadsheet to an existing paralympics database.
+
+    Rows removed from the spreadsheet are not deleted from the database.
+
+    Parameters
+    ----------
+    connection: sqlite connection object
+    cursor: sqlite cursor object
+    data_path: path to the spreadsheet, defaults to paralympics.xlsx in this package
+
+    Returns
+    -------
+    counts: dict of sheet name and the number of rows that were added or updated
+    """
+    sheets = read_sheets(data_path)
+
+    counts = {}
+    try:
+        create_fingerprint_table(cursor)
+        # Add any secondary indexes a database created before they were introduced is missing
+        create_indexes(cursor)
+        for sheet, df, keys, upsert_function in sheets:
+            df_changed, fingerprints = changed_rows(cursor, sheet, df, keys)
+            row_ids = saved_row_ids(cursor, sheet, [key for _, key, _ in fingerprints])
+            row_ids = upsert_function(df_changed, cursor, row_ids)
+            written = [fingerprint + (row_id,) for fingerprint, row_id in zip(fingerprints, row_ids)
+                       if row_id != NOT_WRITTEN]
+            cursor.executemany('INSERT OR REPLACE INTO source_fingerprint (sheet, row_key, fingerprint, row_id) '
+                               'VALUES (?, ?, ?, ?)', written)
+            counts[sheet] = len(written)
+        # All the sheets are updated in one transaction
+        connection.commit()
+        print(f'Rows added or updated: {counts}')
+
+    except sqlite3.Error as e:
+        print(f'An error occurred updating the database. Error: {e}')
+        if connection:
+            connection.rollback()
+        return {}
+    return counts
@@ -0,0 +1,59 @@
+"""
+Streaming reader for the sheets of an Excel workbook, e.g. paralympics.xlsx.
+
+The workbook is opened once in openpyxl's read-only mode and the rows are yielded in batches, so a loader can process
+each sheet as it is read rather than creating a DataFrame for every sheet first.
+"""
+from collections import namedtuple
+
+from openpyxl import load_workbook
+
+
+def row_type(header):
+    """Create a namedtuple class for the rows of a sheet, with a field for each column heading.
+
+    Headings that are not valid Python names are renamed by namedtuple, e.g. to _0.
+    """
+    field_names = [str(name) if name is not None else f'column_{i}' for i, name in enumerate(header)]
+    return namedtuple('Row', field_names, rename=True)
+
+
+def stream_sheets(data_path, sheet_names=None, batch_size=500):
+    """Read the rows of one or more sheets, opening the workbook only once.
+
+    The first row of each sheet is used as the column headings. Cell values keep the type openpyxl reads them as,
+    e.g. int, float, str or datetime, and empty cells are None. Rows where every cell is empty are skipped.
+
+    Parameters
+    ----------
+    data_path: path to the .xlsx file
+    sheet_names: list of the sheets to read, in the order to read them. Defaults to every sheet in workbook order.
+    batch_size: maximum number of rows in each batch
+
+    Yields
+    ------
+    sheet_name, rows: the name of the sheet and a list of up to batch_size namedtuples, one for each row
+    """
+    workbook = load_workbook(data_path, read_only=True, data_only=True)
+    try:
+        for sheet_name in sheet_names or workbook.sheetnames:
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            Row = row_type(header)
+            batch = []
+            for values in rows:
+                if all(value is None for value in values):
+                    continue
+                # Pad or trim the row to the number of headings
+                values = (tuple(values) + (None,) * len(header))[:len(header)]
+                batch.append(Row(*values))
+                if len(batch) == batch_size:
+                    yield sheet_name, batch
+                    batch = []
+            if batch:
+                yield sheet_name, batch
+    finally:
+        # Read-only workbooks keep the file open until they are closed
+        workbook.close()
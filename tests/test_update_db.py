@@ -0,0 +1,236 @@
+"""Tests for the incremental update of the paralympics database in tutor.data.update_db."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from tutor.data import update_db
+from tutor.data.medal_results import repair_medal_results
+
+# The tables written by update_db(), as created by tutor.data.create_db
+SCHEMA_SQL = [
+    '''CREATE TABLE country (code TEXT PRIMARY KEY, name TEXT NOT NULL, region TEXT, sub_region TEXT,
+       member_type TEXT, notes TEXT)''',
+    '''CREATE TABLE host (host_id INTEGER PRIMARY KEY, country_code TEXT NOT NULL, host TEXT NOT NULL)''',
+    '''CREATE TABLE event (event_id INTEGER PRIMARY KEY, type INTEGER NOT NULL, year INTEGER NOT NULL, start TEXT,
+       end TEXT, countries INTEGER, events INTEGER, sports INTEGER, highlights TEXT, url TEXT)''',
+    '''CREATE TABLE participants (participant_id INTEGER PRIMARY KEY, participants_m INTEGER, participants_f INTEGER,
+       participants INTEGER, event_id INTEGER)''',
+    '''CREATE TABLE disability (disability_id INTEGER PRIMARY KEY, category TEXT NOT NULL)''',
+    '''CREATE TABLE host_event (host_id TEXT NOT NULL, event_id INTEGER NOT NULL, PRIMARY KEY (host_id, event_id))''',
+    '''CREATE TABLE disability_event (disability_id INTEGER, event_id INTEGER, PRIMARY KEY (disability_id, event_id))''',
+    '''CREATE TABLE medal_result (result_id INTEGER PRIMARY KEY, event_id INTEGER, country_code TEXT, rank INTEGER,
+       gold INTEGER, silver INTEGER, bronze INTEGER, total INTEGER)''',
+]
+
+TABLES = ['country', 'host', 'event', 'participants', 'host_event', 'disability', 'disability_event', 'medal_result']
+
+
+def event_row(event_type, year, host, country):
+    """Return a row of the events sheet."""
+    return {'type': event_type, 'year': year, 'start': pd.Timestamp(year, 8, 1), 'end': pd.Timestamp(year, 8, 10),
+            'countries': 40, 'events': 300, 'sports': 10, 'highlights': None, 'url': None, 'participants_m': 1000,
+            'participants_f': 500, 'participants': 1500, 'host': host, 'country': country,
+            'disabilities': 'Spinal injury, Amputee'}
+
+
+def medal_row(year, location, npc, gold):
+    """Return a row of the medal_standings sheet."""
+    return {'Year': year, 'Location': location, 'NPC': npc, 'Rank': 1, 'Gold': gold, 'Silver': 1, 'Bronze': 1,
+            'Total': gold + 2}
+
+
+@pytest.fixture
+def sheets():
+    """A small version of paralympics.xlsx, with a summer and a winter games in 1992."""
+    return {
+        'npc_codes': pd.DataFrame([
+            {'code': 'USA', 'name': 'United States of America', 'region': 'Americas', 'sub_region': None,
+             'member_type': 'NPC', 'notes': None},
+            {'code': 'GBR', 'name': 'Great Britain', 'region': 'Europe', 'sub_region': None, 'member_type': 'NPC',
+             'notes': None},
+            {'code': 'ESP', 'name': 'Spain', 'region': 'Europe', 'sub_region': None, 'member_type': 'NPC',
+             'notes': None},
+            {'code': 'FRA', 'name': 'France', 'region': 'Europe', 'sub_region': None, 'member_type': 'NPC',
+             'notes': None},
+        ]),
+        'events': pd.DataFrame([
+            event_row('summer', 1992, 'Barcelona', 'Spain'),
+            event_row('winter', 1992, 'Tignes-Albertville', 'France'),
+            event_row('summer', 2012, 'London', 'Great Britain'),
+        ]),
+        'medal_standings': pd.DataFrame([
+            medal_row(1992, 'Barcelona', 'USA', 75),
+            medal_row(1992, 'Barcelona', 'GBR', 40),
+            medal_row(1992, 'Tignes-Albertville', 'USA', 20),
+            medal_row(2012, 'London', 'GBR', 34),
+        ]),
+    }
+
+
+def write_workbook(path, sheets):
+    """Write the sheets to an .xlsx file."""
+    with pd.ExcelWriter(path) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def dump(connection):
+    """Return every row of the tables written by update_db()."""
+    return {table: connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall() for table in TABLES}
+
+
+@pytest.fixture
+def loaded_db(tmp_path, sheets):
+    """A database loaded from the sheets by update_db(), and the path to the workbook."""
+    data_path = tmp_path / 'paralympics.xlsx'
+    write_workbook(data_path, sheets)
+    connection = sqlite3.connect(':memory:')
+    cursor = connection.cursor()
+    for sql in SCHEMA_SQL:
+        cursor.execute(sql)
+    update_db.update_db(cursor, connection, data_path)
+    yield connection, cursor, data_path
+    connection.close()
+
+
+def medal_results(cursor, year, country_code):
+    """Return (result_id, event type, gold) of a country's medal results in a year."""
+    return cursor.execute('''SELECT medal_result.result_id, event.type, medal_result.gold FROM medal_result
+                             JOIN event ON medal_result.event_id = event.event_id
+                             WHERE event.year = ? AND medal_result.country_code = ? ORDER BY event.type''',
+                          (year, country_code)).fetchall()
+
+
+def test_initial_update_adds_every_row(loaded_db):
+    """
+    GIVEN an empty database
+    WHEN update_db() is run
+    THEN every row of the sheets is added and each medal result is filed under the event of its year and host
+    """
+    connection, cursor, data_path = loaded_db
+    assert len(dump(connection)['medal_result']) == 4
+    assert [(event_type, gold) for _, event_type, gold in medal_results(cursor, 1992, 'USA')] == [
+        ('summer', 75), ('winter', 20)]
+
+
+def test_no_op_update_makes_no_changes(loaded_db):
+    """
+    GIVEN a database that is up to date with the spreadsheet
+    WHEN update_db() is run again
+    THEN no rows are written and the database is unchanged
+    """
+    connection, cursor, data_path = loaded_db
+    before = dump(connection)
+    counts = update_db.update_db(cursor, connection, data_path)
+    assert counts == {'npc_codes': 0, 'events': 0, 'medal_standings': 0}
+    assert dump(connection) == before
+
+
+@pytest.mark.parametrize('saved_row_ids', [True, False])
+def test_changed_summer_row_updates_only_that_row(loaded_db, sheets, saved_row_ids):
+    """
+    GIVEN a database with a summer and a winter result for the USA in 1992
+    WHEN the summer result is changed in the spreadsheet and update_db() is run, with or without the result_ids saved
+        by an earlier update (save_fingerprints() saves none)
+    THEN only the summer result is updated and it keeps its result_id
+    """
+    connection, cursor, data_path = loaded_db
+    if not saved_row_ids:
+        update_db.save_fingerprints(cursor, connection, data_path)
+    before = dump(connection)
+    (summer_id, _, _), (winter_id, _, winter_gold) = medal_results(cursor, 1992, 'USA')
+
+    medals_df = sheets['medal_standings']
+    medals_df.loc[(medals_df['Location'] == 'Barcelona') & (medals_df['NPC'] == 'USA'), 'Gold'] = 99
+    write_workbook(data_path, sheets)
+    counts = update_db.update_db(cursor, connection, data_path)
+
+    assert counts == {'npc_codes': 0, 'events': 0, 'medal_standings': 1}
+    assert medal_results(cursor, 1992, 'USA') == [(summer_id, 'summer', 99), (winter_id, 'winter', winter_gold)]
+    after = dump(connection)
+    assert len(after['medal_result']) == len(before['medal_result'])
+    assert set(after['medal_result']) - set(before['medal_result']) == {
+        row for row in after['medal_result'] if row[0] == summer_id}
+
+
+def test_new_row_is_inserted(loaded_db, sheets):
+    """
+    GIVEN a loaded database
+    WHEN a medal result is added to the spreadsheet and update_db() is run
+    THEN the result is inserted and the existing results are unchanged
+    """
+    connection, cursor, data_path = loaded_db
+    before = dump(connection)
+    sheets['medal_standings'] = pd.concat([sheets['medal_standings'],
+                                           pd.DataFrame([medal_row(2012, 'London', 'USA', 31)])], ignore_index=True)
+    write_workbook(data_path, sheets)
+    counts = update_db.update_db(cursor, connection, data_path)
+
+    assert counts == {'npc_codes': 0, 'events': 0, 'medal_standings': 1}
+    after = dump(connection)
+    assert set(before['medal_result']) < set(after['medal_result'])
+    assert [(event_type, gold) for _, event_type, gold in medal_results(cursor, 2012, 'USA')] == [('summer', 31)]
+
+
+def test_event_with_changed_host_is_updated(loaded_db, sheets):
+    """
+    GIVEN a loaded database
+    WHEN the host of an event is changed in the spreadsheet and update_db() is run
+    THEN the event keeps its event_id and is linked to the new host instead of the old one
+    """
+    connection, cursor, data_path = loaded_db
+    event_id = cursor.execute("SELECT event_id FROM event WHERE year = 2012").fetchone()[0]
+    events_df = sheets['events']
+    events_df.loc[events_df['year'] == 2012, 'host'] = 'Stoke Mandeville'
+    write_workbook(data_path, sheets)
+    counts = update_db.update_db(cursor, connection, data_path)
+
+    assert counts == {'npc_codes': 0, 'events': 1, 'medal_standings': 0}
+    hosts = cursor.execute('''SELECT host_event.event_id, host.host, host.country_code FROM host_event
+                              JOIN host ON host_event.host_id = host.host_id
+                              JOIN event ON host_event.event_id = event.event_id WHERE event.year = 2012''').fetchall()
+    assert hosts == [(event_id, 'Stoke Mandeville', 'GBR')]
+
+
+def test_ambiguous_medal_result_is_not_written(loaded_db, sheets):
+    """
+    GIVEN a database with two results for the same event and country, as filed by the older sqlite3 loaders
+    WHEN the row for that event and country is changed in the spreadsheet and update_db() is run
+    THEN neither result is changed or deleted, and the row is tried again by the next update
+    """
+    connection, cursor, data_path = loaded_db
+    cursor.execute("UPDATE medal_result SET event_id = (SELECT MIN(event_id) FROM event WHERE year = 1992) "
+                   "WHERE event_id IN (SELECT event_id FROM event WHERE year = 1992)")
+    update_db.save_fingerprints(cursor, connection, data_path)
+    before = dump(connection)
+    fingerprint_sql = "SELECT fingerprint FROM source_fingerprint WHERE row_key = '1992 Barcelona USA'"
+    fingerprint = cursor.execute(fingerprint_sql).fetchone()
+
+    medals_df = sheets['medal_standings']
+    medals_df.loc[(medals_df['Location'] == 'Barcelona') & (medals_df['NPC'] == 'USA'), 'Gold'] = 99
+    write_workbook(data_path, sheets)
+    counts = update_db.update_db(cursor, connection, data_path)
+
+    assert counts['medal_standings'] == 0
+    assert dump(connection) == before
+    assert cursor.execute(fingerprint_sql).fetchone() == fingerprint
+
+
+def test_repair_moves_misfiled_medal_results(loaded_db, sheets):
+    """
+    GIVEN a database with the 1992 winter results filed under the summer games, as by the older sqlite3 loaders
+    WHEN the medal results are repaired by schema version 4
+    THEN each result is moved to the event of its year and host, keeps its result_id and none is deleted
+    """
+    connection, cursor, data_path = loaded_db
+    expected = medal_results(cursor, 1992, 'USA')
+    cursor.execute("UPDATE medal_result SET event_id = (SELECT MIN(event_id) FROM event WHERE year = 1992) "
+                   "WHERE event_id IN (SELECT event_id FROM event WHERE year = 1992)")
+
+    assert repair_medal_results(cursor, sheets['medal_standings']) == 1
+    assert medal_results(cursor, 1992, 'USA') == expected
+    assert len(dump(connection)['medal_result']) == 4
+    with pytest.raises(sqlite3.IntegrityError):
+        cursor.execute("UPDATE medal_result SET event_id = (SELECT MIN(event_id) FROM event WHERE year = 1992) "
+                       "WHERE event_id IN (SELECT event_id FROM event WHERE year = 1992)")